@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import threading
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import protocol
+from src.audio_analyzer import AudioAnalyzer
+from src.ble_commands import send_color
+from src.ble_controller import BLEController
+from src.color_algorithms import ColorEngine, ALGORITHMS
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def bench_audio_callback(block_size, window_size=None):
+    analyzer = AudioAnalyzer(chunk_size=block_size, window_size=window_size)
+    analyzer.set_frequency_callback(lambda low, mid, high: None)
+    rng = np.random.default_rng(0)
+    block = (rng.standard_normal((block_size, 1)) * 0.1).astype(np.float32)
+    return lambda: analyzer.audio_callback(block, block_size, None, None), None
+
+
+def bench_algorithm(name):
+    engine = ColorEngine()
+    fn = engine._dispatch[name]
+    return lambda: fn(12.0, 6.0, 3.0), None
+
+
+def bench_queue_send():
+    # Стоимость передачи команды из потока UI в цикл asyncio; сама лента не нужна
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    controller = BLEController(loop)
+
+    async def drain():
+        while True:
+            await controller.command_queue.get()
+            controller.command_queue.task_done()
+
+    drainer = asyncio.run_coroutine_threadsafe(drain(), loop)
+
+    def cleanup():
+        drainer.cancel()
+        loop.call_soon_threadsafe(loop.stop)
+
+    return lambda: controller.queue_send(send_color, (10, 20, 30)), cleanup
+
+
+def simple(fn):
+    return lambda: (fn, None)
+
+
+def collect():
+    # Имя -> фабрика, возвращающая (функция, очистка); готовится только то, что будет запущено
+    benches = {}
+    for block_size in (512, 1024, 2048, 4096):
+        benches[f"audio_callback[{block_size}]"] = lambda n=block_size: bench_audio_callback(n)
+    # Короткий шаг с длинным окном
+    for block_size in (512, 1024):
+        benches[f"audio_callback[{block_size}, window 2048]"] = (
+            lambda n=block_size: bench_audio_callback(n, window_size=2048)
+        )
+    for name in ALGORITHMS:
+        benches[f"algorithm[{name}]"] = lambda n=name: bench_algorithm(n)
+    engine = ColorEngine()
+    benches["hsv_to_rgb"] = simple(lambda: engine.hsv_to_rgb(200.0, 0.8, 0.6))
+    benches["protocol.turn_on"] = simple(protocol.turn_on)
+    benches["protocol.set_color"] = simple(lambda: protocol.set_color(10, 20, 30))
+    benches["protocol.set_brightness"] = simple(lambda: protocol.set_brightness(50))
+    benches["protocol.set_effect"] = simple(lambda: protocol.set_effect(0x87))
+    benches["BLEController.queue_send"] = bench_queue_send
+    return benches
+
+
+def measure(fn, repeat=5):
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    # Минимум по повторам меньше всего зависит от фоновой нагрузки
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def save_baseline(path, results):
+    data = {
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Microbenchmarks for hot paths. Needs no audio device or LED strip."
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update", action="store_true", help="Store the results as the new baseline.")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown relative to the baseline (0.25 = 25%%).")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    regressions = []
+    for name, factory in collect().items():
+        if args.filter not in name:
+            continue
+        fn, cleanup = factory()
+        try:
+            seconds = measure(fn, args.repeat)
+        finally:
+            if cleanup:
+                cleanup()
+        results[name] = seconds
+        line = f"{name:<48} {seconds * 1e6:10.2f} us"
+        base = baseline.get(name)
+        if base:
+            ratio = seconds / base
+            line += f"   x{ratio:.2f} vs baseline"
+            if ratio > 1 + args.threshold:
+                line += "   REGRESSION"
+                regressions.append(name)
+        print(line)
+
+    if args.update:
+        save_baseline(args.baseline, {**baseline, **results})
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
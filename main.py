@@ -3,21 +3,19 @@ import customtkinter as ctk
 from bleak import BleakClient, BleakScanner
 from threading import Thread
 from tkinter import colorchooser
-import json
 import os
 import logging
 import time
-import numpy as np
 import tempfile
 import atexit
 import shutil
+import signal
 import sys
-import win32api
-import win32con
-import win32gui
 
-import ctypes
-from ctypes import wintypes
+if sys.platform == "win32":
+    import win32api
+    import win32con
+    import win32gui
 
 from src.ble_commands import (
     send_turn_on, send_turn_off,
@@ -25,105 +23,60 @@ from src.ble_commands import (
     send_mode, send_effect_speed
 )
 from src.audio_analyzer import AudioAnalyzer
+from src.ble_controller import BLEController
+from src.fake_ble import FakeBleakScanner
+from src.settings_store import SettingsStore
+from src.log_setup import setup_logging
+from src.session_recorder import SessionRecorder
+from src.color_algorithms import ColorEngine, ALGORITHMS, DEFAULT_ALGORITHM
+from src.auto_gain import AutoGain
+from src.ui_bridge import UIBridge
+from src.protocol import turn_off
 
 APP_NAME = "Lotus Lantern"
-APPDATA_PATH = os.path.join(os.environ["APPDATA"], APP_NAME)
+APPDATA_PATH = os.path.join(
+    os.environ.get("APPDATA") or os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"),
+    APP_NAME,
+)
 os.makedirs(APPDATA_PATH, exist_ok=True)
 
 CONFIG_PATH = os.path.join(APPDATA_PATH, "config.json")
 LOG_PATH = os.path.join(APPDATA_PATH, "app.log")
-
-logging.basicConfig(
-    filename=LOG_PATH,
-    level=logging.DEBUG,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    encoding='utf-8'
-)
+RECORDINGS_PATH = os.path.join(APPDATA_PATH, "recordings")
+
+# LOTUS_FAKE_BLE="count=2,latency=0.02,drop=0.01" — работа с имитацией лент вместо Bluetooth
+FAKE_BLE_SPEC = os.environ.get("LOTUS_FAKE_BLE")
+
+DEFAULT_SETTINGS = {
+    "color": (0, 255, 0),
+    "brightness": 50,
+    "mode": "Статический",
+    "effect_speed": 50,
+    "sensitivity": 50,
+    "color_algorithm": DEFAULT_ALGORITHM,
+    "auto_gain": True,
+    "silence_timeout": 5.0,
+    "idle_color": (0, 0, 0),
+    # Дополнительные ленты по каналам: [{"address": ..., "name": ..., "channel": 0}]
+    "zones": [],
+}
+
+ZONE_CHANNELS = {"Левый канал": 0, "Правый канал": 1}
+NEW_PROFILE = "➕ Новый профиль..."
+
+# Кадр выключения готовим заранее — при завершении работы на это нет времени
+OFF_FRAME = bytes(turn_off())
+SHUTDOWN_TIMEOUT = 1.0
+# Переход к цвету простоя при тишине
+FADE_DURATION = 1.0
+FADE_STEPS = 16
+
+setup_logging(LOG_PATH)
 
 loop = asyncio.new_event_loop()
 asyncio.set_event_loop(loop)
 
 
-class BLEController:
-    def __init__(self, command_callback=None):
-        self.client = None
-        self.command_queue = asyncio.Queue()
-        self._connected_device_info = None
-        self._command_callback = command_callback
-
-    async def run(self):
-        while True:
-            try:
-                cmd, args = await self.command_queue.get()
-                if cmd == "connect":
-                    await self._connect(*args)
-                elif cmd == "disconnect":
-                    await self._disconnect()
-                elif cmd == "send":
-                    await self._send_command(*args)
-                self.command_queue.task_done()
-            except Exception as e:
-                logging.error(f"BLEController error: {e}")
-                if self._command_callback:
-                    self._command_callback("error", str(e))
-
-    async def _connect(self, device, on_success):
-        try:
-            self.client = BleakClient(device)
-            await self.client.connect()
-            self._connected_device_info = device.name or device.address
-            logging.info(f"Connected to {self._connected_device_info}")
-            if self._command_callback:
-                self._command_callback("connected", self._connected_device_info)
-            if on_success:
-                on_success()
-        except Exception as e:
-            logging.error(f"Connection failed: {e}")
-            if self._command_callback:
-                self._command_callback("error", str(e))
-
-    async def _disconnect(self):
-        try:
-            if self.client and self.client.is_connected:
-                await self.client.disconnect()
-            self.client = None
-            self._connected_device_info = None
-            if self._command_callback:
-                self._command_callback("disconnected", None)
-        except Exception as e:
-            logging.error(f"Disconnect error: {e}")
-
-    async def _send_command(self, func, *args):
-        if self.client and self.client.is_connected:
-            try:
-                await func(self.client, *args)
-            except Exception as e:
-                logging.error(f"BLE send error: {e}")
-                if self._command_callback:
-                    self._command_callback("error", str(e))
-
-    def queue_connect(self, device, on_success=None):
-        asyncio.run_coroutine_threadsafe(
-            self.command_queue.put(("connect", (device, on_success))), loop
-        )
-
-    def queue_disconnect(self):
-        asyncio.run_coroutine_threadsafe(
-            self.command_queue.put(("disconnect", ())), loop
-        )
-
-    def queue_send(self, func, *args):
-        asyncio.run_coroutine_threadsafe(
-            self.command_queue.put(("send", (func, *args))), loop
-        )
-
-    def is_connected(self):
-        return self.client is not None and self.client.is_connected
-
-    def get_device_name(self):
-        return self._connected_device_info or "Неизвестно"
-
-
 class BLEApp(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -144,17 +97,40 @@ class BLEApp(ctk.CTk):
         self.devices = []
         self.music_mode_active = False
         self.last_music_color = (0, 0, 0)
+        self.zone_colors = {}
+        self._fade_handles = []
         self.last_send_time = 0
-        self.color_history = []
-        self.hue_phase = 0
-        self.pulse_phase = 0
-        self.last_energy = 0
+        self.color_engine = ColorEngine()
+        self.auto_gain_enabled = True
+        self.auto_gain = AutoGain()
+        self.silence_timeout = 5.0
+        self.idle_color = (0, 0, 0)
+        self.recorder = None
+        self._strips_off = False
 
         self.audio_analyzer = AudioAnalyzer()
-        self.ble = BLEController(command_callback=self._on_ble_event)
+        if FAKE_BLE_SPEC:
+            self.scanner = FakeBleakScanner.from_spec(FAKE_BLE_SPEC)
+            self.client_factory = self.scanner.client_factory
+        else:
+            self.scanner = BleakScanner
+            self.client_factory = BleakClient
+        self.ble = BLEController(loop, command_callback=self._on_ble_event, client_factory=self.client_factory)
+        self.zones = []
+        self.zone_config = []
+        self._zone_tasks = {}
+        self.settings = SettingsStore(CONFIG_PATH, DEFAULT_SETTINGS)
+
+        self.spectrum_canvas = None
+        self._spectrum_peak = 1.0
+        self.ui_bridge = UIBridge(self)
+        self.ui_bridge.subscribe("error", self._show_error)
+        self.ui_bridge.subscribe("spectrum", self.update_spectrum)
+        self.ui_bridge.subscribe("link_status", self.update_link_status)
 
         self.load_settings()
         self.create_scan_ui()
+        self.ui_bridge.start()
 
         Thread(target=self._run_loop, daemon=True).start()
         asyncio.run_coroutine_threadsafe(self.ble.run(), loop)
@@ -180,13 +156,17 @@ class BLEApp(ctk.CTk):
             return None
         
     def on_closing(self):
-        self.save_settings()
         self.stop_music_mode()
         self.audio_analyzer.close()
         self.destroy()
 
 
     def _register_shutdown_handler(self):
+        if sys.platform != "win32":
+            signal.signal(signal.SIGTERM, self._on_signal)
+            signal.signal(signal.SIGINT, self._on_signal)
+            logging.info("Shutdown signal handlers registered")
+            return
         try:
             wc = win32gui.WNDCLASS()
             wc.lpfnWndProc = self._shutdown_window_proc
@@ -219,41 +199,57 @@ class BLEApp(ctk.CTk):
         return False
 
 
+    def _on_signal(self, signum, frame):
+        logging.info(f"Received signal {signum}, shutting down")
+        self._safe_turn_off_on_shutdown()
+        self.on_closing()
+
     def _safe_turn_off_on_shutdown(self):
-        if self.ble.is_connected():
-            try:
-                asyncio.run_coroutine_threadsafe(
-                    self._emergency_turn_off(), 
-                    loop
-                )
-                logging.info("Emergency turn off command sent on Windows shutdown")
-                
-                time.sleep(0.3)
-            except Exception as e:
-                logging.error(f"Emergency shutdown failed: {e}")
-                
-    async def _emergency_turn_off(self):
+        # Все ленты выключаются параллельно; ждём не дольше SHUTDOWN_TIMEOUT
+        if self._strips_off:
+            return
+        self._strips_off = True
+        # Сначала глушим поток кадров: иначе запоздавший кадр или шаг затухания снова зажжёт ленту
+        self.stop_music_mode()
+        loop.call_soon_threadsafe(self._cancel_fade)
+        controllers = [self.ble] + [zone[1] for zone in self.zones]
+        controllers = [c for c in controllers if c.is_connected()]
+        if not controllers:
+            return
+        started = time.perf_counter()
         try:
-            await send_turn_off(self.ble.client)
-            command = bytearray([0x7e, 0x00, 0x04, 0x00, 0x00, 0x00, 0xff, 0x00, 0xef])
-            
-            if self.ble.client and self.ble.client.is_connected:
-                for char in self.ble.client.services.characteristics.values():
-                    try:
-                        await self.ble.client.write_gatt_char(char.uuid, command)
-                        break
-                    except:
-                        continue
+            results = asyncio.run_coroutine_threadsafe(
+                self._turn_off_all(controllers), loop
+            ).result(SHUTDOWN_TIMEOUT)
+            failed = [r for r in results if isinstance(r, Exception)]
+            for error in failed:
+                logging.error(f"Shutdown turn off failed: {error}")
+            logging.info(
+                f"Turned off {len(controllers) - len(failed)}/{len(controllers)} strip(s) "
+                f"in {time.perf_counter() - started:.3f} s"
+            )
         except Exception as e:
-            logging.error(f"Direct emergency turn off failed: {e}")
+            logging.error(f"Emergency shutdown failed: {e!r}")
+
+    async def _turn_off_all(self, controllers):
+        return await asyncio.wait_for(
+            asyncio.gather(*(c.shutdown_write(OFF_FRAME) for c in controllers), return_exceptions=True),
+            SHUTDOWN_TIMEOUT,
+        )
 
     def _on_ble_event(self, event_type, data):
+        # Вызывается из потока asyncio; виджеты обновит поток Tk через ui_bridge
         if event_type == "connected":
-            self.after(0, lambda: self._on_connected(data))
+            self.ui_bridge.post(self._on_connected, data)
         elif event_type == "disconnected":
-            self.after(0, self._on_disconnected)
+            self.ui_bridge.post(self._on_disconnected)
+        elif event_type == "reconnecting":
+            self.ui_bridge.publish("link_status", ("reconnecting", data))
+        elif event_type == "reconnected":
+            self.ui_bridge.publish("link_status", ("connected", data))
         elif event_type == "error":
-            self.after(0, lambda: self._show_error(data))
+            # Серия ошибок одной пачкой показывается одним окном
+            self.ui_bridge.publish("error", data)
 
     def _show_error(self, msg):
         try:
@@ -266,6 +262,20 @@ class BLEApp(ctk.CTk):
         self.create_control_ui()
         self.status_device.configure(text=device_name)
         self.status_indicator.configure(fg_color="green")
+        self.restore_zones()
+
+    def update_link_status(self, value):
+        state, stats = value
+        label = getattr(self, "link_status_label", None)
+        if label is None or not label.winfo_exists():
+            return
+        summary = f"Переподключений: {stats['reconnects']}, простой: {stats['downtime']:.1f} с"
+        if state == "reconnecting":
+            self.status_indicator.configure(fg_color="orange")
+            label.configure(text=f"Переподключение (попытка {stats['attempt']})… {summary}")
+        else:
+            self.status_indicator.configure(fg_color="green")
+            label.configure(text=summary)
 
     def _on_disconnected(self):
         self.status_device.configure(text="Не подключено")
@@ -336,6 +346,21 @@ class BLEApp(ctk.CTk):
         self.status_device.pack(side="left")
         self.status_indicator = ctk.CTkFrame(status_frame, width=10, height=10, corner_radius=5, fg_color="green")
         self.status_indicator.pack(side="right", padx=10)
+        self.link_status_label = ctk.CTkLabel(self, text="", font=("Arial", 11), text_color="#AAAAAA")
+        self.link_status_label.pack(pady=(0, 5))
+
+        profile_frame = ctk.CTkFrame(self, fg_color="transparent")
+        profile_frame.pack(pady=(0, 5), padx=30, fill="x")
+        ctk.CTkLabel(profile_frame, text="Профиль:", font=("Arial", 12)).pack(side="left", padx=(0, 10))
+        self.profile_menu = ctk.CTkOptionMenu(
+            profile_frame,
+            values=self.settings.profiles() + [NEW_PROFILE],
+            command=self._on_profile_selected,
+            font=("Arial", 12),
+            dropdown_font=("Arial", 12)
+        )
+        self.profile_menu.set(self.settings.active_profile)
+        self.profile_menu.pack(side="left", fill="x", expand=True)
 
         ctk.CTkButton(
             self, text="Отключиться",
@@ -438,6 +463,17 @@ class BLEApp(ctk.CTk):
 
         ctk.CTkLabel(self.music_settings_frame, text="🎵 Настройки музыкального режима", font=("Arial", 14, "bold")).pack(pady=(10, 5))
 
+        # Элементы холста создаются один раз, дальше меняются только их координаты и цвет
+        self.spectrum_canvas = ctk.CTkCanvas(
+            self.music_settings_frame, width=340, height=40, bg="#1a1a1a", highlightthickness=0
+        )
+        self.spectrum_canvas.pack(pady=5, padx=10)
+        self.spectrum_bars = [
+            self.spectrum_canvas.create_rectangle(10 + i * 70, 40, 70 + i * 70, 40, fill=fill, width=0)
+            for i, fill in enumerate(("#ff4d4d", "#00cc66", "#3b8ed0"))
+        ]
+        self.spectrum_swatch = self.spectrum_canvas.create_rectangle(230, 5, 330, 35, fill="#000000", width=0)
+
         sens_frame = ctk.CTkFrame(self.music_settings_frame, fg_color="transparent")
         sens_frame.pack(pady=5, padx=10, fill="x")
         slider = ctk.CTkSlider(sens_frame, from_=10, to=100, command=self.change_sensitivity)
@@ -451,7 +487,7 @@ class BLEApp(ctk.CTk):
         ctk.CTkLabel(algo_frame, text="Цветовой алгоритм:", font=("Arial", 12)).pack(anchor="w")
         self.algorithm_menu = ctk.CTkOptionMenu(
             algo_frame,
-            values=["Частотный RGB", "Общий вайб", "Спектр музыки", "Пульсирующие волны", "Огненный эквалайзер"],
+            values=ALGORITHMS,
             command=self.change_color_algorithm,
             font=("Arial", 12),
             dropdown_font=("Arial", 12)
@@ -459,17 +495,88 @@ class BLEApp(ctk.CTk):
         self.algorithm_menu.set(self.color_algorithm)
         self.algorithm_menu.pack(fill="x", pady=(5, 0))
 
+        self.auto_gain_switch = ctk.CTkSwitch(
+            self.music_settings_frame,
+            text="Автоусиление",
+            command=self.toggle_auto_gain,
+            font=("Arial", 12)
+        )
+        if self.auto_gain_enabled:
+            self.auto_gain_switch.select()
+        self.auto_gain_switch.pack(pady=(10, 0), padx=10, anchor="w")
+
+        self.record_switch = ctk.CTkSwitch(
+            self.music_settings_frame,
+            text="Запись сессии",
+            command=self.toggle_recording,
+            font=("Arial", 12)
+        )
+        if self.recorder:
+            self.record_switch.select()
+        self.record_switch.pack(pady=(10, 0), padx=10, anchor="w")
+
+        self.zones_frame = ctk.CTkFrame(self.music_settings_frame, fg_color="transparent")
+        self.zones_frame.pack(pady=(10, 0), padx=10, fill="x")
+        self.refresh_zone_list()
+
         ctk.CTkLabel(self.music_settings_frame, text="", height=10).pack()
 
+    def update_spectrum(self, value):
+        canvas = self.spectrum_canvas
+        if canvas is None or not canvas.winfo_exists() or not canvas.winfo_ismapped():
+            return
+        bands, color = value
+        self._spectrum_peak = max(self._spectrum_peak * 0.98, max(bands), 1e-3)
+        for item, level in zip(self.spectrum_bars, bands):
+            x0, _, x1, _ = canvas.coords(item)
+            height = 35 * min(1.0, level / self._spectrum_peak)
+            canvas.coords(item, x0, 40 - height, x1, 40)
+        canvas.itemconfigure(self.spectrum_swatch, fill=self.rgb_to_hex(color))
+
     def change_sensitivity(self, value):
         self.sensitivity = int(value)
         self.sensitivity_value.configure(text=str(int(value)))
+        self.save_settings()
 
     def change_color_algorithm(self, algorithm):
         self.color_algorithm = algorithm
+        self.save_settings()
+
+    def toggle_auto_gain(self):
+        self.auto_gain_enabled = bool(self.auto_gain_switch.get())
+        self.auto_gain.reset()
+        self.save_settings()
+
+    def toggle_recording(self):
+        if self.recorder:
+            self.stop_recording()
+        else:
+            self.start_recording()
+
+    def start_recording(self, path=None):
+        if self.recorder:
+            return self.recorder.path
+        if path is None:
+            os.makedirs(RECORDINGS_PATH, exist_ok=True)
+            path = os.path.join(RECORDINGS_PATH, time.strftime("session-%Y%m%d-%H%M%S.llrec"))
+        try:
+            self.recorder = SessionRecorder(path)
+            logging.info(f"Recording music session to {path}")
+            return path
+        except Exception as e:
+            logging.error(f"Failed to start recording: {e}")
+            self._show_error(f"Не удалось начать запись: {e}")
+            return None
+
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.close()
+            logging.info(f"Recorded {recorder.records_written} frames to {recorder.path}")
 
     def set_mode(self, mode):
         self.current_mode = mode
+        self.save_settings()
         self._toggle_music_settings()
         if mode == "Музыкальный":
             self.start_music_mode()
@@ -483,14 +590,18 @@ class BLEApp(ctk.CTk):
 
     async def _scan_async(self):
         try:
-            self.devices = await BleakScanner.discover()
-            names = [d.name or d.address for d in self.devices] or ["Нет устройств"]
-            self.device_menu.configure(values=names)
-            self.device_menu.set(names[0])
-            self.connect_btn.configure(state="normal" if self.devices else "disabled")
+            devices = await self.scanner.discover()
+            self.ui_bridge.post(self._on_scan_finished, devices)
         except Exception as e:
             logging.error(f"Scan failed: {e}")
-            self.after(0, lambda: self._show_error(f"Сканирование не удалось: {e}"))
+            self.ui_bridge.publish("error", f"Сканирование не удалось: {e}")
+
+    def _on_scan_finished(self, devices):
+        self.devices = devices
+        names = [d.name or d.address for d in self.devices] or ["Нет устройств"]
+        self.device_menu.configure(values=names)
+        self.device_menu.set(names[0])
+        self.connect_btn.configure(state="normal" if self.devices else "disabled")
 
     def connect_device(self):
         try:
@@ -507,20 +618,22 @@ class BLEApp(ctk.CTk):
     def disconnect_device(self):
         self.save_settings()
         self.stop_music_mode()
+        self.close_zones()
         self.ble.queue_disconnect()
 
     def turn_on(self):
-        self.ble.queue_send(send_turn_on)
+        self.ble.queue_send(send_turn_on, force=True)
 
     def turn_off(self):
-        self.ble.queue_send(send_turn_off)
+        self.ble.queue_send(send_turn_off, force=True)
 
     def choose_color(self):
         color = colorchooser.askcolor()[0]
         if color:
             self.current_color = tuple(int(c) for c in color)
             self.update_color_preview()
-            self.ble.queue_send(send_color, self.current_color)
+            self.save_settings()
+            self.ble.queue_send(send_color, self.current_color, force=True)
 
     def update_color_preview(self):
         hex_color = self.rgb_to_hex(self.current_color)
@@ -532,11 +645,13 @@ class BLEApp(ctk.CTk):
         b = max(0, min(100, b))
         self.current_brightness = b
         self.brightness_value.configure(text=str(b))
+        self.save_settings()
         self.ble.queue_send(send_brightness, self.current_brightness)
 
     def change_effect_speed(self, value):
         self.current_effect_speed = int(value)
         self.effect_speed_value.configure(text=str(int(value)))
+        self.save_settings()
         self.ble.queue_send(send_effect_speed, self.current_effect_speed)
 
     def start_music_mode(self):
@@ -546,6 +661,8 @@ class BLEApp(ctk.CTk):
             self.ble.queue_send(send_color, (100, 100, 100))
 
             self.audio_analyzer.set_frequency_callback(self.on_frequency_data)
+            self.audio_analyzer.set_silence_callback(self.on_silence)
+            self.audio_analyzer.silence_timeout = self.silence_timeout
             success = self.audio_analyzer.start_capture()
             if not success:
                 self.music_mode_active = False
@@ -563,182 +680,324 @@ class BLEApp(ctk.CTk):
         if self.music_mode_active:
             self.music_mode_active = False
             self.audio_analyzer.stop_capture()
+            loop.call_soon_threadsafe(self._cancel_fade)
+        self.stop_recording()
+
+    def add_zone(self, device, channel, remember=True):
+        # Дополнительная лента, которая реагирует только на свой канал (0 — левый, 1 — правый)
+        if any(c.get_device_address() == device.address for _, c, _, _ in self.zones):
+            return None
+        controller = BLEController(loop, client_factory=self.client_factory)
+        self._zone_tasks[controller] = asyncio.run_coroutine_threadsafe(controller.run(), loop)
+        controller.queue_connect(device)
+        self.zones.append((channel, controller, ColorEngine(), AutoGain()))
+        if remember:
+            self.zone_config = [z for z in self.zone_config if z["address"] != device.address]
+            self.zone_config.append({"address": device.address, "name": device.name, "channel": channel})
+            self.save_settings()
+        self.audio_analyzer.set_channel_callback(self.on_channel_data)
+        self._ensure_channels(channel + 1)
+        self.refresh_zone_list()
+        return controller
+
+    def _ensure_channels(self, count):
+        analyzer = self.audio_analyzer
+        if count <= analyzer.channels:
+            return
+        analyzer.channels = count
+        # Число каналов потока задаётся при открытии — перезапускаем захват
+        if analyzer.is_running:
+            logging.info(f"Restarting audio capture with {count} channels")
+            analyzer.stop_capture()
+            if not analyzer.start_capture():
+                self.stop_music_mode()
+                self._show_error("Не удалось перезапустить захват звука с новым числом каналов")
+                return
+        if analyzer.is_running and analyzer.active_channels < count:
+            logging.warning(f"Audio device provides only {analyzer.active_channels} channel(s)")
+
+    def remove_zone(self, controller, forget=True):
+        for zone in list(self.zones):
+            if zone[1] is controller:
+                self.zones.remove(zone)
+        address = controller.get_device_address()
+        if forget:
+            self.zone_config = [z for z in self.zone_config if z["address"] != address]
+            self.save_settings()
+        self.zone_colors.pop(controller, None)
+        if not self.zones:
+            self.audio_analyzer.set_channel_callback(None)
+        self.refresh_zone_list()
+        return asyncio.run_coroutine_threadsafe(self._close_zone(controller), loop)
+
+    async def _close_zone(self, controller):
+        await controller.command_queue.put(("disconnect", ()))
+        await controller.command_queue.join()
+        task = self._zone_tasks.pop(controller, None)
+        if task:
+            task.cancel()
+
+    def close_zones(self, timeout=None):
+        # Ленты-зоны отключаются вместе с основной; в настройках они остаются
+        futures = [self.remove_zone(controller, forget=False) for _, controller, _, _ in list(self.zones)]
+        if timeout is not None:
+            deadline = time.perf_counter() + timeout
+            for future in futures:
+                try:
+                    future.result(max(0.0, deadline - time.perf_counter()))
+                except Exception as e:
+                    logging.error(f"Zone disconnect failed: {e!r}")
+
+    def restore_zones(self):
+        for entry in self.zone_config:
+            asyncio.run_coroutine_threadsafe(self._restore_zone(entry), loop)
+
+    async def _restore_zone(self, entry):
+        try:
+            device = await self.scanner.find_device_by_filter(
+                lambda d, ad: d.address == entry["address"], timeout=5.0
+            )
+        except Exception as e:
+            logging.error(f"Zone lookup failed: {e}")
+            device = None
+        if device is None:
+            logging.warning(f"Zone device {entry['name'] or entry['address']} not found")
+            return
+        self.ui_bridge.post(self.add_zone, device, entry["channel"], False)
+
+    def open_zone_dialog(self):
+        dialog = ctk.CTkToplevel(self)
+        dialog.title("Добавить зону")
+        dialog.geometry("320x220")
+        dialog.resizable(False, False)
+        dialog.transient(self)
+
+        ctk.CTkLabel(dialog, text="Лента для отдельного канала", font=("Arial", 14)).pack(pady=(15, 5))
+        device_menu = ctk.CTkOptionMenu(dialog, values=["Сканирование..."], font=("Arial", 13))
+        device_menu.pack(pady=5, padx=20, fill="x")
+        channel_menu = ctk.CTkOptionMenu(dialog, values=list(ZONE_CHANNELS), font=("Arial", 13))
+        channel_menu.pack(pady=5, padx=20, fill="x")
+        add_btn = ctk.CTkButton(dialog, text="Добавить", state="disabled", fg_color="#3b8ed0", hover_color="#36719f")
+        add_btn.pack(pady=10, padx=20, fill="x")
+
+        def on_scan(devices):
+            if not dialog.winfo_exists():
+                return
+            taken = {self.ble.get_device_address()} | {z["address"] for z in self.zone_config}
+            devices = [d for d in devices if d.address not in taken]
+            names = [d.name or d.address for d in devices] or ["Нет устройств"]
+            device_menu.configure(values=names)
+            device_menu.set(names[0])
+
+            def add():
+                name = device_menu.get()
+                if name in names and devices:
+                    self.add_zone(devices[names.index(name)], ZONE_CHANNELS[channel_menu.get()])
+                dialog.destroy()
+
+            add_btn.configure(state="normal" if devices else "disabled", command=add)
+
+        async def scan():
+            try:
+                self.ui_bridge.post(on_scan, await self.scanner.discover())
+            except Exception as e:
+                logging.error(f"Scan failed: {e}")
+                self.ui_bridge.publish("error", f"Сканирование не удалось: {e}")
+
+        asyncio.run_coroutine_threadsafe(scan(), loop)
+
+    def refresh_zone_list(self):
+        frame = getattr(self, "zones_frame", None)
+        if frame is None or not frame.winfo_exists():
+            return
+        for widget in frame.winfo_children():
+            widget.destroy()
+        channel_names = {v: k for k, v in ZONE_CHANNELS.items()}
+        for channel, controller, _, _ in self.zones:
+            row = ctk.CTkFrame(frame, fg_color="transparent")
+            row.pack(fill="x")
+            ctk.CTkLabel(
+                row, text=f"{controller.get_device_name()} — {channel_names.get(channel, channel)}",
+                font=("Arial", 12)
+            ).pack(side="left")
+            ctk.CTkButton(
+                row, text="✖", width=28, height=24, fg_color="#ff4d4d", hover_color="#cc3333",
+                command=lambda c=controller: self.remove_zone(c)
+            ).pack(side="right")
+        ctk.CTkButton(
+            frame, text="➕ Зона по каналу", height=28,
+            fg_color="#3b8ed0", hover_color="#36719f",
+            command=self.open_zone_dialog
+        ).pack(pady=(5, 0), fill="x")
+
+    def on_channel_data(self, channel_freq):
+        if not self.music_mode_active:
+            return
+        try:
+            capture_time = self.audio_analyzer.last_block_time
+            for channel, controller, engine, gain in self.zones:
+                if channel < len(channel_freq) and controller.is_connected():
+                    low_freq, mid_freq, high_freq = channel_freq[channel]
+                    if self.auto_gain_enabled:
+                        low_freq, mid_freq, high_freq = gain.process(low_freq, mid_freq, high_freq)
+                    color = engine.compute(
+                        self.color_algorithm, self.sensitivity, low_freq, mid_freq, high_freq, capture_time
+                    )
+                    controller.queue_stream(send_color, color)
+                    self.zone_colors[controller] = color
+        except Exception as e:
+            logging.error(f"Audio error: {e}")
+
+    def on_silence(self, silent):
+        if not self.music_mode_active:
+            return
+        if silent:
+            # Один плавный переход к цвету простоя, дальше лента не получает команд до появления звука
+            logging.info("Music mode idle: no signal")
+            end = self.idle_color
+            fades = [(self.ble, self.last_music_color, end)]
+            for channel, controller, engine, gain in self.zones:
+                fades.append((controller, self.zone_colors.get(controller, end), end))
+                self.zone_colors[controller] = end
+            loop.call_soon_threadsafe(self._start_fade, fades)
+            self.last_music_color = end
+            self.ui_bridge.publish("spectrum", ((0, 0, 0), end))
+        else:
+            logging.info("Music mode resumed")
+            loop.call_soon_threadsafe(self._cancel_fade)
+            self.color_engine.color_history.clear()
+
+    def _start_fade(self, fades):
+        # Выполняется в цикле asyncio: шаги перехода распределены по FADE_DURATION,
+        # иначе при записи без подтверждения они уходят разом и лента просто перескакивает
+        self._cancel_fade()
+        for i in range(1, FADE_STEPS):
+            for controller, start, end in fades:
+                color = tuple(int(s + (e - s) * i / FADE_STEPS) for s, e in zip(start, end))
+                self._fade_handles.append(
+                    loop.call_later(FADE_DURATION * i / FADE_STEPS, controller.queue_stream, send_color, color)
+                )
+        # Последний шаг — с подтверждением: потерянный кадр оставил бы ленту гореть весь простой
+        for controller, start, end in fades:
+            self._fade_handles.append(loop.call_later(
+                FADE_DURATION, lambda c=controller, color=end: c.queue_send(send_color, color, force=True)
+            ))
+
+    def _cancel_fade(self):
+        for handle in self._fade_handles:
+            handle.cancel()
+        self._fade_handles = []
 
     def on_frequency_data(self, low_freq, mid_freq, high_freq):
         if not self.music_mode_active or not self.ble.is_connected():
             return
         try:
-            if self.color_algorithm == "Частотный RGB":
-                color = self.algorithm_frequency_rgb(low_freq, mid_freq, high_freq)
-            elif self.color_algorithm == "Общий вайб":
-                color = self.algorithm_energy_based(low_freq, mid_freq, high_freq)
-            elif self.color_algorithm == "Спектр музыки":
-                color = self.algorithm_music_spectrum(low_freq, mid_freq, high_freq)
-            elif self.color_algorithm == "Пульсирующие волны":
-                color = self.algorithm_pulse_waves(low_freq, mid_freq, high_freq)
-            elif self.color_algorithm == "Огненный эквалайзер":
-                color = self.algorithm_fire_equalizer(low_freq, mid_freq, high_freq)
-            else:
-                color = self.algorithm_energy_based(low_freq, mid_freq, high_freq)
-
-            self.color_history.append(color)
-            if len(self.color_history) > 3: # Настройка длины истории для сглаживания
-                self.color_history.pop(0)
-            avg_r = sum(c[0] for c in self.color_history) // len(self.color_history)
-            avg_g = sum(c[1] for c in self.color_history) // len(self.color_history)
-            avg_b = sum(c[2] for c in self.color_history) // len(self.color_history)
-            color = (avg_r, avg_g, avg_b)
+            if self.auto_gain_enabled:
+                # Признаки приводятся к стабильному диапазону до цветовых алгоритмов
+                low_freq, mid_freq, high_freq = self.auto_gain.process(low_freq, mid_freq, high_freq)
+            # Состояние алгоритмов продвигается по времени захвата блока, а не по числу вызовов
+            capture_time = self.audio_analyzer.last_block_time
+            color = self.color_engine.compute(
+                self.color_algorithm, self.sensitivity, low_freq, mid_freq, high_freq, capture_time
+            )
             self.last_music_color = color
+            self.ui_bridge.publish("spectrum", ((low_freq, mid_freq, high_freq), color))
+
+            latency = self.ble.latency
+            latency.update_analysis(capture_time)
 
             current_time = time.time()
-            if current_time - self.last_send_time > 0.016: # Настройка частоты отправки
-                self.ble.queue_send(send_color, color)
+            sent = current_time - self.last_send_time > 0.016 # Настройка частоты отправки
+            if sent:
+                frame_period = self.audio_analyzer.chunk_size / self.audio_analyzer.sample_rate
+                self.ble.queue_send_timed(latency.deadline(capture_time, frame_period), send_color, color)
                 self.last_send_time = current_time
+
+            recorder = self.recorder
+            if recorder:
+                recorder.record(low_freq, mid_freq, high_freq, color, sent, timestamp=capture_time)
         except Exception as e:
             logging.error(f"Audio error: {e}")
 
-    def algorithm_frequency_rgb(self, low_freq, mid_freq, high_freq):
-        sensitivity = self.sensitivity / 50.0
-        r = int(np.clip(low_freq * sensitivity * 15, 0, 255))
-        g = int(np.clip(mid_freq * sensitivity * 12, 0, 255))
-        b = int(np.clip(high_freq * sensitivity * 10, 0, 255))
-        max_val = max(r, g, b)
-        if max_val > 0 and max_val < 100:
-            scale = 200 / max_val
-            r = min(255, int(r * scale))
-            g = min(255, int(g * scale))
-            b = min(255, int(b * scale))
-        return (r, g, b)
-
-    def algorithm_energy_based(self, low_freq, mid_freq, high_freq):
-        sensitivity = self.sensitivity / 50.0
-        total_energy = (low_freq + mid_freq + high_freq) * sensitivity
-        total = low_freq + mid_freq + high_freq + 0.001
-        low_ratio = low_freq / total
-        mid_ratio = mid_freq / total
-        high_ratio = high_freq / total
-        if low_ratio > 0.6:
-            base_hue = 0
-        elif mid_ratio > 0.6:
-            base_hue = 120
-        elif high_ratio > 0.6:
-            base_hue = 240
-        else:
-            base_hue = (low_ratio * 0 + mid_ratio * 120 + high_ratio * 240) % 360
-        self.hue_phase = (self.hue_phase + total_energy * 0.1) % 360
-        hue = (base_hue + self.hue_phase) % 360
-        saturation = min(1.0, total_energy * 0.02)
-        value = min(1.0, total_energy * 0.01)
-        return self.hsv_to_rgb(hue, saturation, value)
-
-    def algorithm_music_spectrum(self, low_freq, mid_freq, high_freq):
-        sensitivity = self.sensitivity / 50.0
-        bass_energy = low_freq * sensitivity * 20
-        melody_energy = mid_freq * sensitivity * 15
-        treble_energy = high_freq * sensitivity * 10
-        is_bass_heavy = bass_energy > melody_energy * 1.5
-        is_treble_heavy = treble_energy > melody_energy * 1.5
-        if is_bass_heavy:
-            r, g, b = bass_energy * 2, melody_energy, treble_energy * 0.5
-        elif is_treble_heavy:
-            r, g, b = bass_energy * 0.5, melody_energy, treble_energy * 2
-        else:
-            r, g, b = bass_energy * 1.2, melody_energy * 1.5, treble_energy * 1.2
-        r = int(255 * (min(r, 255) / 255) ** 0.8)
-        g = int(255 * (min(g, 255) / 255) ** 0.7)
-        b = int(255 * (min(b, 255) / 255) ** 0.9)
-        return (r, g, b)
-
-    def algorithm_pulse_waves(self, low_freq, mid_freq, high_freq):
-        sensitivity = self.sensitivity / 50.0
-        total_energy = (low_freq + mid_freq + high_freq) * sensitivity
-        energy_change = abs(total_energy - self.last_energy)
-        self.last_energy = total_energy
-        if energy_change > 5:
-            self.pulse_phase = (self.pulse_phase + 30) % 360
-        self.pulse_phase = (self.pulse_phase + 0.5) % 360
-        hue = (self.pulse_phase + low_freq * 2) % 360
-        saturation = min(1.0, 0.7 + mid_freq * 0.01)
-        value = min(1.0, 0.3 + total_energy * 0.015)
-        if energy_change > 10:
-            value = min(1.0, value * 1.5)
-        return self.hsv_to_rgb(hue, saturation, value)
-
-    def algorithm_fire_equalizer(self, low_freq, mid_freq, high_freq):
-        sensitivity = self.sensitivity / 50.0
-        fire_colors = [(20,0,0), (50,0,0), (100,10,0), (150,30,0), (200,60,0), (255,100,0), (255,150,50)]
-        total_energy = (low_freq * 0.5 + mid_freq * 0.3 + high_freq * 0.2) * sensitivity
-        temperature = min(len(fire_colors) - 1, int(total_energy * 0.5))
-        flicker = high_freq * 20
-        base_color = fire_colors[temperature]
-        r = min(255, base_color[0] + int(flicker))
-        g = min(255, base_color[1] + int(flicker * 0.5))
-        b = min(255, base_color[2] + int(flicker * 0.2))
-        return (r, g, b)
-
-    def hsv_to_rgb(self, h, s, v):
-        h = h % 360
-        s = max(0, min(1, s))
-        v = max(0, min(1, v))
-        c = v * s
-        x = c * (1 - abs((h / 60) % 2 - 1))
-        m = v - c
-        if h < 60: r, g, b = c, x, 0
-        elif h < 120: r, g, b = x, c, 0
-        elif h < 180: r, g, b = 0, c, x
-        elif h < 240: r, g, b = 0, x, c
-        elif h < 300: r, g, b = x, 0, c
-        else: r, g, b = c, 0, x
-        return (int((r + m) * 255), int((g + m) * 255), int((b + m) * 255))
-
     def rgb_to_hex(self, rgb):
         return "#{:02x}{:02x}{:02x}".format(*rgb)
 
     def save_settings(self):
-        config = {
+        # Запись откладывается и выполняется в фоновом потоке SettingsStore
+        self.settings.save({
             "color": self.current_color,
             "brightness": self.current_brightness,
             "mode": self.current_mode,
             "effect_speed": self.current_effect_speed,
             "sensitivity": self.sensitivity,
-            "color_algorithm": self.color_algorithm
-        }
-        try:
-            with open(CONFIG_PATH, "w", encoding='utf-8') as f:
-                json.dump(config, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logging.error(f"Error saving settings: {e}")
+            "color_algorithm": self.color_algorithm,
+            "auto_gain": self.auto_gain_enabled,
+            "silence_timeout": self.silence_timeout,
+            "idle_color": self.idle_color,
+            "zones": self.zone_config,
+        })
 
     def load_settings(self):
-        if not os.path.exists(CONFIG_PATH):
-            return
+        self.apply_settings(self.settings.load())
+
+    def apply_settings(self, config):
         try:
-            with open(CONFIG_PATH, "r", encoding='utf-8') as f:
-                config = json.load(f)
-                self.current_color = tuple(config.get("color", (0, 255, 0)))
-                # Support older config values saved in 0-255 range by mapping to 0-100
-                raw_b = config.get("brightness", 50)
-                try:
-                    raw_b = int(raw_b)
-                except Exception:
-                    raw_b = 50
-                if raw_b > 100:
-                    # map 0-255 -> 0-100
-                    mapped = int(round(raw_b * 100.0 / 255.0))
-                    self.current_brightness = max(0, min(100, mapped))
-                else:
-                    self.current_brightness = max(0, min(100, raw_b))
-                self.current_mode = config.get("mode", "Статический")
-                self.current_effect_speed = config.get("effect_speed", 50)
-                self.sensitivity = config.get("sensitivity", 50)
-                self.color_algorithm = config.get("color_algorithm", "Общий вайб")
+            self.current_color = tuple(config["color"])
+            self.current_brightness = max(0, min(100, int(config["brightness"])))
+            self.current_mode = config["mode"]
+            self.current_effect_speed = config["effect_speed"]
+            self.sensitivity = config["sensitivity"]
+            self.color_algorithm = config["color_algorithm"]
+            self.auto_gain_enabled = bool(config["auto_gain"])
+            self.silence_timeout = float(config["silence_timeout"])
+            self.idle_color = tuple(config["idle_color"])
+            self.zone_config = [dict(zone) for zone in config["zones"]]
         except Exception as e:
             logging.error(f"Error loading settings: {e}")
 
+    def _on_profile_selected(self, choice):
+        if choice == NEW_PROFILE:
+            name = ctk.CTkInputDialog(text="Название профиля:", title="Новый профиль").get_input()
+            name = (name or "").strip()
+            if not name or name == NEW_PROFILE:
+                self.profile_menu.set(self.settings.active_profile)
+                return
+            choice = name
+        self.switch_profile(choice)
+
+    def switch_profile(self, name):
+        # Новый профиль создаётся копией текущего (так работает SettingsStore.switch_profile)
+        if name == self.settings.active_profile:
+            return
+        self.save_settings()
+        self.stop_music_mode()
+        self.close_zones()
+        self.apply_settings(self.settings.switch_profile(name))
+        if self.ble.is_connected():
+            self.create_control_ui()
+            self.status_device.configure(text=self.ble.get_device_name())
+            self.apply_state_to_strip()
+            self.restore_zones()
+
+    def apply_state_to_strip(self):
+        # Повторяем на ленте состояние профиля; совпадающее с текущим отфильтрует тень BLEController
+        if self.current_mode == "Музыкальный":
+            self.start_music_mode()
+        else:
+            self.turn_on()
+            self.ble.queue_send(send_mode, self.current_mode)
+            if self.current_mode == "Статический":
+                self.ble.queue_send(send_color, self.current_color)
+        self.ble.queue_send(send_brightness, self.current_brightness)
+        self.ble.queue_send(send_effect_speed, self.current_effect_speed)
+
     def destroy(self):
+        self.ui_bridge.stop()
         self.save_settings()
         self.stop_music_mode()
+        self.close_zones(timeout=SHUTDOWN_TIMEOUT)
         self.audio_analyzer.close()
+        self.settings.close()
         super().destroy()
 
 
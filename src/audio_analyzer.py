@@ -1,23 +1,60 @@
 import sounddevice as sd
+import logging
 import numpy as np
 import threading
 import time
 from collections import deque
 
+
+# Границы полос (Гц): низкие, средние, высокие
+BANDS = ((20, 200), (200, 1500), (1500, 6000))
+LOW_GAIN = 3
+
+
+def band_masks(frequencies):
+    return [(frequencies >= lo) & (frequencies < hi) for lo, hi in BANDS]
+
+
+def band_features(magnitude, masks):
+    # magnitude: (..., bins) -> (..., 3); работает и для одного блока, и для пачки кадров
+    features = np.empty(magnitude.shape[:-1] + (len(masks),))
+    for i, mask in enumerate(masks):
+        features[..., i] = magnitude[..., mask].mean(axis=-1) if np.any(mask) else 0.001
+    features[..., 0] *= LOW_GAIN
+    return features
+
+
 class AudioAnalyzer:
-    def __init__(self, sample_rate=44100, chunk_size=2048):
+    def __init__(self, sample_rate=44100, chunk_size=2048, channels=1,
+                 silence_threshold=1e-4, silence_timeout=5.0, window_size=None):
         self.sample_rate = sample_rate
         self.chunk_size = chunk_size
+        # Длина окна анализа в исходных отсчётах; может быть больше блока,
+        # тогда короткий шаг не ухудшает разрешение по низким частотам
+        self.window_size = window_size or chunk_size
+        self.channels = channels
+        self._configure_window()
+        self.silence_threshold = silence_threshold
+        self.silence_timeout = silence_timeout
+        self.silence_callback = None
+        self.is_silent = False
+        self.silent_blocks = 0
+        self._quiet_since = None
+        self.active_channels = 0
         self.is_running = False
         self.stream = None
         self.volume_callback = None
         self.frequency_callback = None
+        self.channel_callback = None
         
         self.volume_history = deque(maxlen=5)
         self.frequency_history = deque(maxlen=5)
         
         self.last_volume = 0
         self.last_frequencies = (0, 0, 0)
+        self.last_channel_frequencies = None
+        self.last_block_time = 0.0
+        self.input_latency = 0.0
         self.callback_count = 0
 
     def list_audio_devices(self):
@@ -56,12 +93,14 @@ class AudioAnalyzer:
 
     def audio_callback(self, indata, frames, time_info, status):
         self.callback_count += 1
+        self.last_block_time = self._block_time(frames, time_info)
 
-        if self.volume_callback or self.frequency_callback:
+        if self.volume_callback or self.frequency_callback or self.channel_callback:
             if indata is None or len(indata) == 0:
                 return
                 
-            audio_data = indata[:, 0]
+            # (каналы, отсчёты): все каналы обрабатываются одним пакетным rfft
+            audio_data = indata.T
             
             volume = np.sqrt(np.mean(audio_data**2))
             self.volume_history.append(volume)
@@ -70,34 +109,94 @@ class AudioAnalyzer:
             
             if self.volume_callback:
                 self.volume_callback(smoothed_volume)
+
+            if self._update_silence(volume):
+                # Тишина: БПФ и отправка цветов не нужны
+                self.silent_blocks += 1
+                return
+
+            if self.buffered:
+                audio_data = self._analysis_window(audio_data)
             
-            if self.frequency_callback and len(audio_data) > 10:
+            if (self.frequency_callback or self.channel_callback) and audio_data.shape[1] > 10:
                 try:
-                    window = np.hanning(len(audio_data))
-                    windowed_data = audio_data * window
-                    
-                    fft_data = np.fft.rfft(windowed_data)
-                    frequencies = np.fft.rfftfreq(len(windowed_data), 1/self.sample_rate)
-                    magnitude = np.abs(fft_data)
-                    
-                    low_mask = (frequencies >= 20) & (frequencies < 200)
-                    mid_mask = (frequencies >= 200) & (frequencies < 1500)
-                    high_mask = (frequencies >= 1500) & (frequencies < 6000)
+                    window, masks = self._get_window(audio_data.shape[1])
+                    magnitude = np.abs(np.fft.rfft(audio_data * window, axis=-1))
+                    channel_freq = band_features(magnitude, masks)
                     
-                    low_freq = np.mean(magnitude[low_mask]) if np.any(low_mask) else 0.001
-                    mid_freq = np.mean(magnitude[mid_mask]) if np.any(mid_mask) else 0.001
-                    high_freq = np.mean(magnitude[high_mask]) if np.any(high_mask) else 0.001
-                    
-                    low_freq *= 3
-                    
-                    self.frequency_history.append((low_freq, mid_freq, high_freq))
-                    smoothed_freq = np.mean(list(self.frequency_history), axis=0)
+                    self.frequency_history.append(channel_freq)
+                    smoothed_channels = np.mean(list(self.frequency_history), axis=0)
+                    smoothed_freq = smoothed_channels.mean(axis=0)
                     self.last_frequencies = smoothed_freq
+                    self.last_channel_frequencies = smoothed_channels
                     
-                    self.frequency_callback(*smoothed_freq)
+                    if self.frequency_callback:
+                        self.frequency_callback(*smoothed_freq)
+                    if self.channel_callback:
+                        self.channel_callback(smoothed_channels)
                         
                 except Exception as e:
-                    print(f"Error in FFT: {e}")
+                    logging.error(f"Error in FFT: {e}")
+
+    def _configure_window(self):
+        self._window_cache = {}
+        self._window_buffer = None
+        # Скользящее окно нужно, когда окно анализа не совпадает с блоком;
+        # иначе БПФ считается прямо по блоку
+        self.buffered = self.window_size != self.chunk_size
+
+    def _analysis_window(self, audio_data):
+        # Последние window_size отсчётов каждого канала
+        if self._window_buffer is None or self._window_buffer.shape[0] != audio_data.shape[0]:
+            self._window_buffer = np.zeros((audio_data.shape[0], self.window_size))
+        n = min(audio_data.shape[1], self.window_size)
+        self._window_buffer = np.concatenate([self._window_buffer[:, n:], audio_data[:, -n:]], axis=1)
+        return self._window_buffer
+
+    def _update_silence(self, volume):
+        # Громкость блока уже посчитана, поэтому проверка почти бесплатна.
+        # В тишину уходим после silence_timeout секунд без сигнала, выходим на первом же громком блоке.
+        if self.silence_threshold is None:
+            return False
+        if volume >= self.silence_threshold:
+            self._quiet_since = None
+            if self.is_silent:
+                self.is_silent = False
+                if self.silence_callback:
+                    self.silence_callback(False)
+            return False
+        if self._quiet_since is None:
+            self._quiet_since = self.last_block_time
+        if not self.is_silent and self.last_block_time - self._quiet_since >= self.silence_timeout:
+            self.is_silent = True
+            self.frequency_history.clear()
+            self._window_buffer = None
+            if self.silence_callback:
+                self.silence_callback(True)
+        return self.is_silent
+
+    def _block_time(self, frames, time_info):
+        # Момент записи последнего отсчёта блока в шкале time.perf_counter().
+        # PortAudio даёт время АЦП первого отсчёта в своей шкале; если его нет, вычитаем задержку входа потока.
+        now = time.perf_counter()
+        block = frames / self.sample_rate
+        try:
+            adc_time = time_info.inputBufferAdcTime
+            current = time_info.currentTime
+        except AttributeError:
+            adc_time = current = 0
+        if adc_time and current and 0 <= current - adc_time < 1.0:
+            return now - (current - adc_time) + block
+        return now - self.input_latency
+
+    def _get_window(self, n):
+        # Окно и маски полос зависят только от длины блока — считаем один раз
+        cached = self._window_cache.get(n)
+        if cached is None:
+            frequencies = np.fft.rfftfreq(n, 1/self.sample_rate)
+            cached = (np.hanning(n), band_masks(frequencies))
+            self._window_cache[n] = cached
+        return cached
 
     def start_capture(self):
         if self.is_running:
@@ -111,19 +210,26 @@ class AudioAnalyzer:
             return False
 
         try:
+            max_channels = sd.query_devices(device_index)['max_input_channels']
+            self.active_channels = max(1, min(self.channels, max_channels))
+            self.frequency_history.clear()
+            self._configure_window()
+            self.is_silent = False
+            self._quiet_since = None
             self.stream = sd.InputStream(
                 device=device_index,
-                channels=1,
+                channels=self.active_channels,
                 samplerate=self.sample_rate,
                 blocksize=self.chunk_size,
                 callback=self.audio_callback
             )
+            self.input_latency = self.stream.latency
             self.is_running = True
             self.stream.start()
             return True
                 
         except Exception as e:
-            print(f"❌ Failed to start SYSTEM audio capture: {e}")
+            logging.error(f"Failed to start system audio capture: {e}")
             return False
 
     def stop_capture(self):
@@ -138,7 +244,11 @@ class AudioAnalyzer:
             "volume": self.last_volume,
             "frequencies": self.last_frequencies,
             "is_running": self.is_running,
-            "callback_count": self.callback_count
+            "channels": self.active_channels,
+            "callback_count": self.callback_count,
+            "is_silent": self.is_silent,
+            "silent_blocks": self.silent_blocks,
+            "input_latency": self.input_latency
         }
 
     def set_volume_callback(self, callback):
@@ -147,5 +257,13 @@ class AudioAnalyzer:
     def set_frequency_callback(self, callback):
         self.frequency_callback = callback
 
+    def set_silence_callback(self, callback):
+        # callback(True) при переходе в тишину, callback(False) при появлении сигнала
+        self.silence_callback = callback
+
+    def set_channel_callback(self, callback):
+        # callback(features) с массивом (каналы, 3): низкие/средние/высокие для каждого канала
+        self.channel_callback = callback
+
     def close(self):
         self.stop_capture()
\ No newline at end of file
@@ -0,0 +1,104 @@
+class P2Quantile:
+    # Потоковая оценка квантиля алгоритмом P² (Jain & Chlamtac): пять маркеров, O(1) памяти
+    def __init__(self, p):
+        self.p = p
+        self.n = 0
+        self._initial = []
+        self.heights = []
+        self.positions = [1.0, 2.0, 3.0, 4.0, 5.0]
+        self.desired = [1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0]
+        self.increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, x):
+        self.n += 1
+        if self.n <= 5:
+            self._initial.append(x)
+            if self.n == 5:
+                self.heights = sorted(self._initial)
+            return
+
+        q, n = self.heights, self.positions
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        for i in (1, 2, 3):
+            d = self.desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                candidate = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < candidate < q[i + 1]:
+                    candidate = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = candidate
+                n[i] += d
+
+    def value(self):
+        if self.n >= 5:
+            return self.heights[2]
+        if not self._initial:
+            return 0.0
+        ordered = sorted(self._initial)
+        return ordered[int(round(self.p * (len(ordered) - 1)))]
+
+
+class BandGain:
+    # Нижний и верхний квантили одной полосы. Оценки периодически начинаются заново,
+    # чтобы усиление подстраивалось под новый трек; пока новая пара не прогрелась, работает старая.
+    def __init__(self, low_q, high_q, window, warmup):
+        self.low_q = low_q
+        self.high_q = high_q
+        self.window = window
+        self.warmup = warmup
+        self.current = (P2Quantile(low_q), P2Quantile(high_q))
+        self.previous = None
+
+    def add(self, x):
+        low, high = self.current
+        low.add(x)
+        high.add(x)
+        if low.n >= self.window:
+            self.previous = self.current
+            self.current = (P2Quantile(self.low_q), P2Quantile(self.high_q))
+
+    def bounds(self):
+        source = self.current
+        if source[0].n < self.warmup and self.previous is not None:
+            source = self.previous
+        return source[0].value(), source[1].value()
+
+
+class AutoGain:
+    # Приводит признаки полос к стабильному диапазону 0..target независимо от громкости трека
+    def __init__(self, bands=3, target=20.0, low_q=0.1, high_q=0.95,
+                 window=1300, warmup=50, min_span=0.05):
+        self.target = target
+        self.min_span = min_span
+        self._band_args = (low_q, high_q, window, warmup)
+        self.bands = [BandGain(*self._band_args) for _ in range(bands)]
+
+    def process(self, *features):
+        out = []
+        for band, x in zip(self.bands, features):
+            band.add(x)
+            lo, hi = band.bounds()
+            # Нижняя граница шума не даёт растянуть тишину до полной яркости
+            span = max(hi - lo, self.min_span)
+            out.append(min(1.5, max(0.0, (x - lo) / span)) * self.target)
+        return tuple(out)
+
+    def reset(self):
+        self.bands = [BandGain(*self._band_args) for _ in self.bands]
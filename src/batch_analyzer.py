@@ -0,0 +1,129 @@
+import argparse
+import os
+import time
+import wave
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .audio_analyzer import band_masks, band_features
+from .color_algorithms import ColorEngine, ALGORITHMS, DEFAULT_ALGORITHM
+from .session_recorder import RECORD_DTYPE, FLAG_SENT, write_recording, SessionPlayer
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+
+def read_audio(path):
+    # WAV читается стандартной библиотекой, остальные форматы — через soundfile, если он установлен
+    if soundfile is not None:
+        data, sample_rate = soundfile.read(path, dtype="float32", always_2d=True)
+        return data.mean(axis=1), sample_rate
+
+    with wave.open(path, "rb") as wav:
+        sample_rate = wav.getframerate()
+        channels = wav.getnchannels()
+        width = wav.getsampwidth()
+        raw = wav.readframes(wav.getnframes())
+
+    if width == 1:
+        data = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        data = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    elif width == 3:
+        b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+        ints = np.where(ints & 0x800000, ints - 0x1000000, ints)
+        data = ints.astype(np.float32) / 8388608
+    elif width == 4:
+        data = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported sample width: {width}")
+    return data.reshape(-1, channels).mean(axis=1), sample_rate
+
+
+def analyze_signal(signal, sample_rate, chunk_size=2048, hop=None, smoothing=5, batch_frames=1024):
+    # Та же обработка, что и в AudioAnalyzer.audio_callback, но сразу для всех кадров трека
+    hop = hop or chunk_size
+    if len(signal) < chunk_size:
+        signal = np.pad(signal, (0, chunk_size - len(signal)))
+
+    frames = sliding_window_view(signal, chunk_size)[::hop]
+    window = np.hanning(chunk_size).astype(np.float32)
+    masks = band_masks(np.fft.rfftfreq(chunk_size, 1/sample_rate))
+
+    features = np.empty((len(frames), len(masks)))
+    for start in range(0, len(frames), batch_frames):
+        # Пачками, чтобы не держать в памяти спектр всего трека
+        batch = frames[start:start + batch_frames] * window
+        magnitude = np.abs(np.fft.rfft(batch, axis=1))
+        features[start:start + batch_frames] = band_features(magnitude, masks)
+
+    if smoothing > 1:
+        # Скользящее среднее как у frequency_history (deque maxlen=smoothing)
+        csum = np.cumsum(np.vstack([np.zeros((1, features.shape[1])), features]), axis=0)
+        idx = np.arange(1, len(features) + 1)
+        lo = np.maximum(idx - smoothing, 0)
+        features = (csum[idx] - csum[lo]) / (idx - lo)[:, None]
+
+    # Момент, когда блок целиком получен — так же срабатывает живой callback
+    times = (np.arange(len(frames)) * hop + chunk_size) / sample_rate
+    return times, features
+
+
+def render_track(times, features, algorithm=DEFAULT_ALGORITHM, sensitivity=50):
+    engine = ColorEngine()
+    records = np.zeros(len(times), dtype=RECORD_DTYPE)
+    records["t"] = times
+    records["low"], records["mid"], records["high"] = features.T
+    records["flags"] = FLAG_SENT
+    colors = np.empty((len(times), 3), dtype=np.uint8)
+    for i, (t, (low, mid, high)) in enumerate(zip(times.tolist(), features.tolist())):
+        colors[i] = engine.compute(algorithm, sensitivity, low, mid, high, t)
+    records["r"], records["g"], records["b"] = colors.T
+    return records
+
+
+def build_light_track(audio_path, out_path, algorithm=DEFAULT_ALGORITHM, sensitivity=50,
+                      chunk_size=2048, hop=None):
+    signal, sample_rate = read_audio(audio_path)
+    times, features = analyze_signal(signal, sample_rate, chunk_size, hop)
+    records = render_track(times, features, algorithm, sensitivity)
+    write_recording(out_path, records)
+    return records
+
+
+def play_with_audio(audio_path, track_path, controllers, lead=None, on_finished=None, sent_only=True):
+    # Запускает песню и заранее рассчитанную дорожку от одной точки отсчёта.
+    # Кадры уходят раньше звука на измеренную задержку BLE за вычетом задержки вывода звука.
+    import sounddevice as sd
+
+    signal, sample_rate = read_audio(audio_path)
+    sd.play(signal, sample_rate)
+    if lead is None:
+        output_latency = sd.get_stream().latency
+        lead = max((c.latency.lead(output_latency) for c in controllers), default=-output_latency)
+    player = SessionPlayer(track_path, controllers, lead=lead, sent_only=sent_only)
+    player.start(on_finished)
+    return player
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute a light track for an audio file.")
+    parser.add_argument("audio", nargs="+", help="Audio files (WAV, or any format soundfile supports).")
+    parser.add_argument("--algorithm", default=DEFAULT_ALGORITHM, choices=ALGORITHMS)
+    parser.add_argument("--sensitivity", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, default=2048)
+    parser.add_argument("--hop", type=int, default=None)
+    args = parser.parse_args()
+
+    for audio_path in args.audio:
+        out_path = os.path.splitext(audio_path)[0] + ".llrec"
+        started = time.perf_counter()
+        records = build_light_track(
+            audio_path, out_path, args.algorithm, args.sensitivity, args.chunk_size, args.hop
+        )
+        elapsed = time.perf_counter() - started
+        print(f"{audio_path}: {len(records)} frames -> {out_path} ({elapsed:.2f}s)")
@@ -8,23 +8,25 @@ from .protocol import (
 
 CHAR_UUID = "0000fff3-0000-1000-8000-00805f9b34fb"
 
-async def send_turn_on(client: BleakClient):
-    await client.write_gatt_char(CHAR_UUID, turn_on())
+# response=False — запись без подтверждения (write-without-response), используется для потока цветов
 
-async def send_turn_off(client: BleakClient):
-    await client.write_gatt_char(CHAR_UUID, turn_off())
+async def send_turn_on(client: BleakClient, response: bool = True):
+    await client.write_gatt_char(CHAR_UUID, turn_on(), response=response)
 
-async def send_color(client: BleakClient, rgb: tuple[int, int, int]):
+async def send_turn_off(client: BleakClient, response: bool = True):
+    await client.write_gatt_char(CHAR_UUID, turn_off(), response=response)
+
+async def send_color(client: BleakClient, rgb: tuple[int, int, int], response: bool = True):
     r, g, b = rgb
-    await client.write_gatt_char(CHAR_UUID, set_color(r, g, b))
+    await client.write_gatt_char(CHAR_UUID, set_color(r, g, b), response=response)
 
-async def send_brightness(client: BleakClient, value: int):
-    await client.write_gatt_char(CHAR_UUID, set_brightness(value))
+async def send_brightness(client: BleakClient, value: int, response: bool = True):
+    await client.write_gatt_char(CHAR_UUID, set_brightness(value), response=response)
 
-async def send_effect_speed(client: BleakClient, speed: int):
-    await client.write_gatt_char(CHAR_UUID, set_effect_speed(speed))
+async def send_effect_speed(client: BleakClient, speed: int, response: bool = True):
+    await client.write_gatt_char(CHAR_UUID, set_effect_speed(speed), response=response)
 
-async def send_mode(client: BleakClient, mode: str):
+async def send_mode(client: BleakClient, mode: str, response: bool = True):
     mode_map = {
         "Статический": "crossfade_white",
         "Переливание": "crossfade_red_green_blue_yellow_cyan_magenta_white",
@@ -38,4 +40,4 @@ async def send_mode(client: BleakClient, mode: str):
     if effect_key not in EFFECTS:
         raise ValueError(f"Unknown mode: {mode}")
     effect_code = EFFECTS[effect_key]
-    await client.write_gatt_char(CHAR_UUID, set_effect(effect_code))
\ No newline at end of file
+    await client.write_gatt_char(CHAR_UUID, set_effect(effect_code), response=response)
\ No newline at end of file
@@ -0,0 +1,399 @@
+import asyncio
+import logging
+import random
+import time
+
+from bleak import BleakClient
+
+from .latency import LatencyTracker
+
+from .ble_commands import (
+    CHAR_UUID,
+    send_turn_on, send_turn_off,
+    send_color, send_brightness,
+    send_mode, send_effect_speed
+)
+
+# Какое поле состояния ленты меняет каждая команда
+SHADOW_FIELDS = {
+    send_turn_on: lambda: ("power", True),
+    send_turn_off: lambda: ("power", False),
+    send_color: lambda rgb: ("color", tuple(rgb)),
+    send_brightness: lambda value: ("brightness", value),
+    send_mode: lambda mode: ("mode", mode),
+    send_effect_speed: lambda speed: ("effect_speed", speed),
+}
+
+# Порядок повторной отправки после переподключения; цвет и режим взаимоисключающие
+RESYNC_ORDER = (
+    ("power", lambda on: (send_turn_on,) if on else (send_turn_off,)),
+    ("mode", lambda mode: (send_mode, mode)),
+    ("color", lambda rgb: (send_color, rgb)),
+    ("brightness", lambda value: (send_brightness, value)),
+    ("effect_speed", lambda speed: (send_effect_speed, speed)),
+)
+
+
+class DeviceShadow:
+    # Последнее подтверждённое состояние ленты; записи, которые его не меняют, не отправляются.
+    # Кадры потока идут без подтверждения, поэтому хранятся отдельно и подтверждённое состояние не заменяют
+    def __init__(self):
+        self.state = {}
+        self.skipped = 0
+        # Записи потока в полёте: поле -> (значение, номер записи)
+        self.pending = {}
+        # Последнее отправленное потоком значение; дошло ли оно — неизвестно
+        self.streamed = {}
+        self._seq = 0
+
+    def is_redundant(self, field, value):
+        return field in self.state and self.state[field] == value
+
+    def is_redundant_stream(self, field, value):
+        # Для потока сравниваем с тем, что окажется на ленте после уже начатых записей
+        if field in self.pending:
+            return self.pending[field][0] == value
+        if field in self.streamed:
+            return self.streamed[field] == value
+        return self.is_redundant(field, value)
+
+    def schedule(self, field, value):
+        self._seq += 1
+        self.pending[field] = (value, self._seq)
+        return self._seq
+
+    def settle(self, field, value, seq, sent):
+        # Неподтверждённая запись делает подтверждённое значение поля неизвестным
+        self.state.pop(field, None)
+        if field == "color":
+            self.state.pop("mode", None)
+        if sent:
+            self.streamed[field] = value
+        else:
+            self.streamed.pop(field, None)
+        # Снимаем отметку, только если за этой записью не запланирована более новая
+        if field in self.pending and self.pending[field][1] == seq:
+            del self.pending[field]
+
+    def desired(self):
+        # Что нужно вернуть на ленту после переподключения: последнее намерение по каждому полю
+        return {**self.state, **self.streamed}
+
+    def acknowledge(self, field, value):
+        self.state[field] = value
+        self.streamed.pop(field, None)
+        # Цвет выключает эффект, эффект перекрывает цвет
+        if field == "color":
+            self.state.pop("mode", None)
+            self.streamed.pop("mode", None)
+        elif field == "mode":
+            self.state.pop("color", None)
+            self.streamed.pop("color", None)
+
+    def invalidate(self, field=None):
+        if field is None:
+            self.state.clear()
+            self.streamed.clear()
+        else:
+            self.state.pop(field, None)
+            self.streamed.pop(field, None)
+
+
+class BLEController:
+    def __init__(self, loop, command_callback=None, client_factory=BleakClient, max_in_flight=4,
+                 reconnect=True, backoff_base=0.5, backoff_max=30.0):
+        self.loop = loop
+        self.client = None
+        self._client_factory = client_factory
+        self.command_queue = asyncio.Queue()
+        self._connected_device_info = None
+        self._command_callback = command_callback
+        self._shadows = {}
+        self.shadow = DeviceShadow()
+        self.latency = LatencyTracker()
+        self.stale_dropped = 0
+        # Поток цветов пишется без подтверждения, не больше max_in_flight записей одновременно
+        self.max_in_flight = max_in_flight
+        self.without_response = False
+        self._window = asyncio.Semaphore(max(1, max_in_flight))
+        self._in_flight = set()
+        # Супервизор соединения: переподключение с экспоненциальной задержкой после обрыва
+        self.reconnect = reconnect
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.reconnect_count = 0
+        self.downtime = 0.0
+        self._device = None
+        self._down_since = None
+        self._user_disconnect = False
+        self._shut_down = False
+        self._reconnect_task = None
+        self._dropped_again = False
+
+    async def run(self):
+        while True:
+            try:
+                cmd, args = await self.command_queue.get()
+                if self._shut_down and cmd in ("send", "force", "stream", "resync"):
+                    # После shutdown_write лента должна остаться выключенной
+                    pass
+                elif cmd == "connect":
+                    await self._connect(*args)
+                elif cmd == "disconnect":
+                    await self._disconnect()
+                elif cmd == "send":
+                    await self._send_command(*args)
+                elif cmd == "force":
+                    await self._send_command(*args, force=True)
+                elif cmd == "stream":
+                    deadline, func, *func_args = args
+                    if deadline is not None and time.perf_counter() > deadline:
+                        # Кадр опоздал — за ним в очереди уже более свежий
+                        self.stale_dropped += 1
+                    else:
+                        await self._stream_command(func, *func_args)
+                elif cmd == "resync":
+                    await self._resync()
+                self.command_queue.task_done()
+            except Exception as e:
+                logging.error(f"BLEController error: {e}")
+                if self._command_callback:
+                    self._command_callback("error", str(e))
+
+    async def _connect(self, device, on_success):
+        try:
+            self._device = device
+            self._user_disconnect = False
+            self._shut_down = False
+            await self._open_client(device)
+            if self._command_callback:
+                self._command_callback("connected", self._connected_device_info)
+            if on_success:
+                on_success()
+        except Exception as e:
+            self._device = None
+            logging.error(f"Connection failed: {e}")
+            if self._command_callback:
+                self._command_callback("error", str(e))
+
+    async def _open_client(self, device):
+        self.client = self._client_factory(device, disconnected_callback=self._on_client_disconnected)
+        await self.client.connect()
+        self._connected_device_info = device.name or device.address
+        logging.info(f"Connected to {self._connected_device_info}")
+        char = self.client.services.get_characteristic(CHAR_UUID)
+        self.without_response = (
+            self.max_in_flight > 0
+            and char is not None
+            and "write-without-response" in char.properties
+        )
+        self.shadow = self._shadows.setdefault(device.address, DeviceShadow())
+        if self.shadow.desired():
+            # Лента могла потерять состояние, пока мы были отключены
+            await self._resync()
+
+    def _on_client_disconnected(self, client):
+        # Bleak может вызвать это из своего потока — дальше работаем в цикле asyncio
+        self.loop.call_soon_threadsafe(self._handle_disconnect, client)
+
+    def _handle_disconnect(self, client):
+        if client is not self.client or self._user_disconnect or not self.reconnect:
+            return
+        if self._reconnect_task is not None and not self._reconnect_task.done():
+            # Обрыв во время переподключения (чаще всего во время resync) — цикл должен повторить попытку
+            self._dropped_again = True
+            return
+        logging.warning(f"Connection to {self._connected_device_info} lost, reconnecting")
+        self._down_since = time.monotonic()
+        self._reconnect_task = self.loop.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self):
+        attempt = 0
+        while not self._user_disconnect:
+            attempt += 1
+            if self._command_callback:
+                self._command_callback("reconnecting", {"attempt": attempt, **self.link_stats()})
+            # Экспоненциальная задержка со случайной составляющей, чтобы ленты не ломились разом
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            if self._user_disconnect:
+                return
+            self._dropped_again = False
+            try:
+                await self._open_client(self._device)
+            except Exception as e:
+                logging.warning(f"Reconnect attempt {attempt} failed: {e}")
+                continue
+            # Ошибки записи при resync проглатываются в _send_command, поэтому проверяем связь явно
+            if self._dropped_again or not self.client.is_connected:
+                logging.warning(f"Reconnect attempt {attempt}: link dropped again during resync")
+                continue
+            self.reconnect_count += 1
+            self.downtime += time.monotonic() - self._down_since
+            self._down_since = None
+            logging.info(f"Reconnected after {attempt} attempt(s)")
+            if self._command_callback:
+                self._command_callback("reconnected", self.link_stats())
+            return
+
+    def _awaiting_reconnect(self):
+        # Связь потеряна не по воле пользователя — супервизор её восстановит
+        return self.reconnect and not self._user_disconnect and self._device is not None
+
+    def link_stats(self):
+        downtime = self.downtime
+        if self._down_since is not None:
+            downtime += time.monotonic() - self._down_since
+        return {"reconnects": self.reconnect_count, "downtime": downtime}
+
+    async def _disconnect(self):
+        try:
+            self._user_disconnect = True
+            if self._reconnect_task is not None:
+                self._reconnect_task.cancel()
+                self._reconnect_task = None
+            if self._down_since is not None:
+                self.downtime += time.monotonic() - self._down_since
+                self._down_since = None
+            await self._drain(timeout=1.0)
+            if self.client and self.client.is_connected:
+                await self.client.disconnect()
+            self.client = None
+            self._connected_device_info = None
+            if self._command_callback:
+                self._command_callback("disconnected", None)
+        except Exception as e:
+            logging.error(f"Disconnect error: {e}")
+
+    async def _send_command(self, func, *args, force=False):
+        entry = SHADOW_FIELDS.get(func)
+        field, value = entry(*args) if entry else (None, None)
+        if not (self.client and self.client.is_connected):
+            if field and self._awaiting_reconnect():
+                # Во время переподключения запоминаем желаемое состояние — его применит resync
+                self.shadow.acknowledge(field, value)
+            return
+        if field and not force and self.shadow.is_redundant(field, value):
+            self.shadow.skipped += 1
+            return
+        try:
+            # Управляющие команды идут с подтверждением и только после уже начатых записей потока
+            await self._drain()
+            started = time.perf_counter()
+            await func(self.client, *args)
+            self.latency.update_ble(time.perf_counter() - started)
+            if field:
+                self.shadow.acknowledge(field, value)
+        except Exception as e:
+            if field and not self.client.is_connected and self._awaiting_reconnect():
+                # Запись не дошла из-за обрыва — значение применит resync после переподключения
+                self.shadow.acknowledge(field, value)
+            elif field:
+                self.shadow.invalidate(field)
+            logging.error(f"BLE send error: {e}")
+            if self._command_callback:
+                self._command_callback("error", str(e))
+
+    async def _stream_command(self, func, *args):
+        # Кадры потока во время обрыва просто теряются — следующий кадр всё равно свежее
+        if not (self.client and self.client.is_connected):
+            return
+        if not self.without_response:
+            await self._send_command(func, *args)
+            return
+        entry = SHADOW_FIELDS.get(func)
+        field, value = entry(*args) if entry else (None, None)
+        if field and self.shadow.is_redundant_stream(field, value):
+            self.shadow.skipped += 1
+            return
+        await self._window.acquire()
+        seq = self.shadow.schedule(field, value) if field else None
+        # Задачи стартуют в порядке создания и сразу передают запись в Bleak,
+        # поэтому порядок кадров для одной ленты сохраняется
+        task = self.loop.create_task(
+            self._write_unacknowledged(self.client, self.shadow, func, args, field, value, seq)
+        )
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _write_unacknowledged(self, client, shadow, func, args, field, value, seq):
+        sent = False
+        try:
+            await func(client, *args, response=False)
+            sent = True
+        except Exception as e:
+            logging.error(f"BLE stream error: {e}")
+            if self._command_callback:
+                self._command_callback("error", str(e))
+        finally:
+            if field:
+                shadow.settle(field, value, seq, sent)
+            self._window.release()
+
+    async def _drain(self, timeout=None):
+        if self._in_flight:
+            done, pending = await asyncio.wait(set(self._in_flight), timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+    async def _resync(self):
+        desired = self.shadow.desired()
+        self.shadow.invalidate()
+        for field, command in RESYNC_ORDER:
+            if field in desired:
+                await self._send_command(*command(desired[field]), force=True)
+        if not self.is_connected():
+            # Связь оборвалась посреди resync: неотправленное состояние нужно следующей попытке
+            for field, value in desired.items():
+                self.shadow.state.setdefault(field, value)
+
+    def queue_connect(self, device, on_success=None):
+        asyncio.run_coroutine_threadsafe(
+            self.command_queue.put(("connect", (device, on_success))), self.loop
+        )
+
+    def queue_disconnect(self):
+        asyncio.run_coroutine_threadsafe(
+            self.command_queue.put(("disconnect", ())), self.loop
+        )
+
+    def queue_send(self, func, *args, force=False):
+        # force=True — разовое действие пользователя (кнопка, выбор цвета): отправляется,
+        # даже если тень считает его лишним — ленту могли переключить пультом или другим приложением
+        asyncio.run_coroutine_threadsafe(
+            self.command_queue.put(("force" if force else "send", (func, *args))), self.loop
+        )
+
+    def queue_stream(self, func, *args, deadline=None):
+        # Потоковые кадры (музыка, воспроизведение). deadline в шкале time.perf_counter();
+        # опоздавший кадр отбрасывается
+        asyncio.run_coroutine_threadsafe(
+            self.command_queue.put(("stream", (deadline, func, *args))), self.loop
+        )
+
+    def queue_send_timed(self, deadline, func, *args):
+        self.queue_stream(func, *args, deadline=deadline)
+
+    async def shutdown_write(self, frame):
+        # Прямая запись в обход очереди: при завершении работы ждать накопившиеся кадры некогда
+        self._user_disconnect = True
+        self._shut_down = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        client = self.client
+        if client and client.is_connected:
+            await client.write_gatt_char(CHAR_UUID, frame, response=True)
+
+    def queue_resync(self):
+        asyncio.run_coroutine_threadsafe(
+            self.command_queue.put(("resync", ())), self.loop
+        )
+
+    def is_connected(self):
+        return self.client is not None and self.client.is_connected
+
+    def get_device_address(self):
+        return self._device.address if self._device else None
+
+    def get_device_name(self):
+        return self._connected_device_info or "Неизвестно"
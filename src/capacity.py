@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import time
+
+from .ble_commands import send_color
+from .ble_controller import BLEController
+from .fake_ble import FakeBleakScanner, parse_spec
+
+
+async def run_capacity_test(devices, rate, duration, profile):
+    # Гоняет поток цветов через настоящие BLEController на имитированных лентах
+    loop = asyncio.get_running_loop()
+    scanner = FakeBleakScanner(devices, profile)
+    controllers = [BLEController(loop, client_factory=scanner.client_factory) for _ in scanner.devices]
+    workers = [loop.create_task(c.run()) for c in controllers]
+
+    for controller, device in zip(controllers, scanner.devices):
+        controller.queue_connect(device)
+    while not all(c.is_connected() for c in controllers):
+        await asyncio.sleep(0.01)
+
+    interval = 1.0 / rate
+    offered = 0
+    started = time.perf_counter()
+    next_tick = started
+    while time.perf_counter() - started < duration:
+        color = (offered % 256, (offered * 7) % 256, (offered * 13) % 256)
+        for controller in controllers:
+            controller.queue_stream(send_color, color)
+        offered += 1
+        next_tick += interval
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+    backlog = max(c.command_queue.qsize() for c in controllers)
+
+    try:
+        await asyncio.wait_for(asyncio.gather(*(c.command_queue.join() for c in controllers)), duration)
+    except asyncio.TimeoutError:
+        pass
+    drained = time.perf_counter() - started
+
+    for worker in workers:
+        worker.cancel()
+
+    stats = [scanner.clients[d.address].stats.as_dict() for d in scanner.devices]
+    applied = sum(s["applied"] for s in stats)
+    return {
+        "devices": devices,
+        "rate": rate,
+        "offered": offered * devices,
+        "applied": applied,
+        "achieved_rate": applied / drained / devices,
+        "backlog": backlog,
+        "avg_latency": sum(s["avg_latency"] for s in stats) / devices,
+        "max_latency": max(s["max_latency"] for s in stats),
+    }
+
+
+def format_result(r):
+    return (
+        f"{r['devices']} dev @ {r['rate']:.0f}/s: applied {r['applied']}/{r['offered']}, "
+        f"achieved {r['achieved_rate']:.1f}/s per device, backlog {r['backlog']}, "
+        f"latency avg {r['avg_latency'] * 1000:.1f} ms / max {r['max_latency'] * 1000:.1f} ms"
+    )
+
+
+async def main(args):
+    _, profile = parse_spec(args.link)
+    rate = args.rate
+    while True:
+        result = await run_capacity_test(args.devices, rate, args.duration, profile)
+        print(format_result(result))
+        # При поиске предела удваиваем частоту, пока лента успевает за потоком
+        if not args.sweep or result["achieved_rate"] < rate * 0.95 or result["backlog"] > rate:
+            break
+        rate *= 2
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Estimate how many strips and what update rate one host can drive.")
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--rate", type=float, default=30.0, help="Colour updates per second per device.")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--link", default="", help="Link profile, e.g. 'latency=0.02,jitter=0.005,drop=0.01,rate=60,tx=0.0075'.")
+    parser.add_argument("--sweep", action="store_true", help="Double the rate until the link saturates.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,176 @@
+import numpy as np
+
+ALGORITHMS = ["Частотный RGB", "Общий вайб", "Спектр музыки", "Пульсирующие волны", "Огненный эквалайзер"]
+DEFAULT_ALGORITHM = "Общий вайб"
+
+# Коэффициенты алгоритмов подбирались под блок 2048 отсчётов при 44100 Гц.
+# Состояние продвигается пропорционально прошедшему времени, а не числу кадров.
+REFERENCE_DT = 2048 / 44100
+# Длинные паузы (тишина, пропущенные кадры) не должны давать скачок фазы
+MAX_DT = 0.25
+
+
+class ColorEngine:
+    def __init__(self, history_length=3):
+        self.sensitivity = 50
+        self.history_length = history_length # Настройка длины истории для сглаживания
+        self.color_history = []
+        self.hue_phase = 0
+        self.pulse_phase = 0
+        self.last_energy = 0
+        self.last_time = None
+        self.clock = 0.0
+        self.dt = REFERENCE_DT
+        self.pulse_direction = 0
+        self.pulse_budget = 0.0
+        self._dispatch = {
+            "Частотный RGB": self.algorithm_frequency_rgb,
+            "Общий вайб": self.algorithm_energy_based,
+            "Спектр музыки": self.algorithm_music_spectrum,
+            "Пульсирующие волны": self.algorithm_pulse_waves,
+            "Огненный эквалайзер": self.algorithm_fire_equalizer,
+        }
+
+    def compute(self, algorithm, sensitivity, low_freq, mid_freq, high_freq, timestamp=None):
+        # timestamp — момент захвата блока в секундах; без него каждый вызов считается одним опорным кадром
+        self.sensitivity = sensitivity
+        if timestamp is None or self.last_time is None:
+            self.dt = REFERENCE_DT
+        else:
+            self.dt = min(MAX_DT, max(0.0, timestamp - self.last_time))
+        self.last_time = timestamp
+        self.clock += self.dt
+        algorithm_fn = self._dispatch.get(algorithm, self.algorithm_energy_based)
+        color = algorithm_fn(low_freq, mid_freq, high_freq)
+
+        # Сглаживание по окну времени длиной history_length опорных кадров
+        self.color_history.append((self.clock, color))
+        window = (self.history_length - 0.5) * REFERENCE_DT
+        while self.clock - self.color_history[0][0] > window:
+            self.color_history.pop(0)
+        colors = [c for _, c in self.color_history]
+        avg_r = sum(c[0] for c in colors) // len(colors)
+        avg_g = sum(c[1] for c in colors) // len(colors)
+        avg_b = sum(c[2] for c in colors) // len(colors)
+        return (avg_r, avg_g, avg_b)
+
+    def reset(self):
+        self.color_history = []
+        self.hue_phase = 0
+        self.pulse_phase = 0
+        self.last_energy = 0
+        self.last_time = None
+        self.clock = 0.0
+        self.dt = REFERENCE_DT
+        self.pulse_direction = 0
+        self.pulse_budget = 0.0
+
+    def algorithm_frequency_rgb(self, low_freq, mid_freq, high_freq):
+        sensitivity = self.sensitivity / 50.0
+        r = int(np.clip(low_freq * sensitivity * 15, 0, 255))
+        g = int(np.clip(mid_freq * sensitivity * 12, 0, 255))
+        b = int(np.clip(high_freq * sensitivity * 10, 0, 255))
+        max_val = max(r, g, b)
+        if max_val > 0 and max_val < 100:
+            scale = 200 / max_val
+            r = min(255, int(r * scale))
+            g = min(255, int(g * scale))
+            b = min(255, int(b * scale))
+        return (r, g, b)
+
+    def algorithm_energy_based(self, low_freq, mid_freq, high_freq):
+        sensitivity = self.sensitivity / 50.0
+        total_energy = (low_freq + mid_freq + high_freq) * sensitivity
+        total = low_freq + mid_freq + high_freq + 0.001
+        low_ratio = low_freq / total
+        mid_ratio = mid_freq / total
+        high_ratio = high_freq / total
+        if low_ratio > 0.6:
+            base_hue = 0
+        elif mid_ratio > 0.6:
+            base_hue = 120
+        elif high_ratio > 0.6:
+            base_hue = 240
+        else:
+            base_hue = (low_ratio * 0 + mid_ratio * 120 + high_ratio * 240) % 360
+        self.hue_phase = (self.hue_phase + total_energy * 0.1 * self.dt / REFERENCE_DT) % 360
+        hue = (base_hue + self.hue_phase) % 360
+        saturation = min(1.0, total_energy * 0.02)
+        value = min(1.0, total_energy * 0.01)
+        return self.hsv_to_rgb(hue, saturation, value)
+
+    def algorithm_music_spectrum(self, low_freq, mid_freq, high_freq):
+        sensitivity = self.sensitivity / 50.0
+        bass_energy = low_freq * sensitivity * 20
+        melody_energy = mid_freq * sensitivity * 15
+        treble_energy = high_freq * sensitivity * 10
+        is_bass_heavy = bass_energy > melody_energy * 1.5
+        is_treble_heavy = treble_energy > melody_energy * 1.5
+        if is_bass_heavy:
+            r, g, b = bass_energy * 2, melody_energy, treble_energy * 0.5
+        elif is_treble_heavy:
+            r, g, b = bass_energy * 0.5, melody_energy, treble_energy * 2
+        else:
+            r, g, b = bass_energy * 1.2, melody_energy * 1.5, treble_energy * 1.2
+        r = int(255 * (min(r, 255) / 255) ** 0.8)
+        g = int(255 * (min(g, 255) / 255) ** 0.7)
+        b = int(255 * (min(b, 255) / 255) ** 0.9)
+        return (r, g, b)
+
+    def algorithm_pulse_waves(self, low_freq, mid_freq, high_freq):
+        sensitivity = self.sensitivity / 50.0
+        total_energy = (low_freq + mid_freq + high_freq) * sensitivity
+        steps = self.dt / REFERENCE_DT
+        # Скорость изменения энергии в пересчёте на опорный кадр, чтобы пороги не зависели от частоты вызовов
+        delta = total_energy - self.last_energy
+        energy_change = abs(delta) / steps if steps > 0 else 0.0
+        self.last_energy = total_energy
+        # Фаза получает 30° за каждый опорный кадр выше порога. Начавшийся всплеск длится не меньше
+        # одного опорного кадра, поэтому резкий удар даёт тот же толчок при любой длине шага.
+        # Смена направления — новый всплеск, а не продолжение прежнего
+        over = energy_change > 5
+        direction = (1 if delta > 0 else -1) if over else 0
+        if over and direction != self.pulse_direction:
+            self.pulse_budget = 1.0
+            credit = min(steps, 1.0)
+        elif over:
+            credit = steps
+        else:
+            credit = min(steps, self.pulse_budget)
+        self.pulse_budget = max(0.0, self.pulse_budget - steps)
+        self.pulse_direction = direction
+        self.pulse_phase = (self.pulse_phase + 30 * credit) % 360
+        self.pulse_phase = (self.pulse_phase + 0.5 * steps) % 360
+        hue = (self.pulse_phase + low_freq * 2) % 360
+        saturation = min(1.0, 0.7 + mid_freq * 0.01)
+        value = min(1.0, 0.3 + total_energy * 0.015)
+        if energy_change > 10:
+            value = min(1.0, value * 1.5)
+        return self.hsv_to_rgb(hue, saturation, value)
+
+    def algorithm_fire_equalizer(self, low_freq, mid_freq, high_freq):
+        sensitivity = self.sensitivity / 50.0
+        fire_colors = [(20,0,0), (50,0,0), (100,10,0), (150,30,0), (200,60,0), (255,100,0), (255,150,50)]
+        total_energy = (low_freq * 0.5 + mid_freq * 0.3 + high_freq * 0.2) * sensitivity
+        temperature = min(len(fire_colors) - 1, int(total_energy * 0.5))
+        flicker = high_freq * 20
+        base_color = fire_colors[temperature]
+        r = min(255, base_color[0] + int(flicker))
+        g = min(255, base_color[1] + int(flicker * 0.5))
+        b = min(255, base_color[2] + int(flicker * 0.2))
+        return (r, g, b)
+
+    def hsv_to_rgb(self, h, s, v):
+        h = h % 360
+        s = max(0, min(1, s))
+        v = max(0, min(1, v))
+        c = v * s
+        x = c * (1 - abs((h / 60) % 2 - 1))
+        m = v - c
+        if h < 60: r, g, b = c, x, 0
+        elif h < 120: r, g, b = x, c, 0
+        elif h < 180: r, g, b = 0, c, x
+        elif h < 240: r, g, b = 0, x, c
+        elif h < 300: r, g, b = x, 0, c
+        else: r, g, b = c, 0, x
+        return (int((r + m) * 255), int((g + m) * 255), int((b + m) * 255))
@@ -1,56 +1,170 @@
 import asyncio
 import argparse
+import sys
 from bleak import BleakClient, BleakScanner
 
 from protocol import COMMANDS, EFFECTS
+from fake_ble import FakeBleakScanner
+
+# Replaced by --fake to run against simulated strips instead of Bluetooth.
+Scanner = BleakScanner
+Client = BleakClient
 
 
 # Print all found devices.
 async def scan():
     print("Scanning for devices...")
-    devices = await BleakScanner.discover()
+    devices = await Scanner.discover()
 
     for device in devices:
         print(device)
 
 
 # Send a command to a given device.
-async def send_command(command: bytearray, client: BleakClient):
-    for characteristic in client.services.characteristics.values():
+# Returns the characteristics that accepted it so later commands can skip the others.
+async def send_command(command: bytearray, client: BleakClient, characteristics=None):
+    if characteristics is None:
+        characteristics = [c.uuid for c in client.services.characteristics.values()]
+    accepted = []
+    for uuid in characteristics:
         try:
             # For some reason it only works when sending the command twice.
             for i in range(0, 2):
                 # Don't know why but without reading we can't write
-                await client.read_gatt_char(characteristic.uuid)
+                await client.read_gatt_char(uuid)
 
-                await client.write_gatt_char(characteristic.uuid, command)
+                await client.write_gatt_char(uuid, command)
+            accepted.append(uuid)
         except:
             # Seems like ELK-BLEDOM needs to write to the first characteristic and ELK-BLEDOB to the last one. Just ignore errors
             pass
+    return accepted
+
+
+# Turn 'set_color 255 0 0' into a command frame, None if the command is unknown.
+def parse_command(text: str):
+    argCommand, *rest = text.split()
+    key = next(
+        (
+            command
+            for command, fn in COMMANDS.items()
+            if command.startswith(argCommand)
+        ),
+        None,
+    )
+    if key is None:
+        return None
 
-
-# Connect to a device using name or uuid, send 1 command and then disconnect.
-async def send_command_once(command: bytearray, name: str = None, uuid: str = None):
-    if name is not None:
-        device = await BleakScanner.find_device_by_filter(
-            lambda device, data: device.name == name
-        )
-    elif uuid is not None:
-        device = await BleakScanner.find_device_by_filter(
-            lambda device, data: device.address == uuid
-        )
+    if key == "set_effect <effect>":
+        intParams = [EFFECTS[rest[0]]]
     else:
+        intParams = [int(param) for param in rest]
+
+    return COMMANDS[key](*intParams)
+
+
+# Parse a script into steps: ("send", frame), ("wait", seconds) or ("loop", count, steps).
+# 'loop <n>' repeats everything up to the matching 'end'; 'loop' without a count repeats forever.
+def parse_script(lines):
+    root = []
+    stack = [root]
+    for number, line in enumerate(lines, 1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        word, *rest = line.split()
+        if word == "end":
+            if len(stack) == 1:
+                raise ValueError(f"Line {number}: 'end' without 'loop'")
+            stack.pop()
+            continue
+        # Ошибки разбора аргументов привязываем к строке скрипта
+        try:
+            if word == "wait":
+                item = ("wait", float(rest[0]))
+            elif word == "loop":
+                item = ("loop", int(rest[0]) if rest else None, [])
+            else:
+                command = parse_command(line)
+                item = None if command is None else ("send", command)
+        except (KeyError, IndexError, ValueError, TypeError) as e:
+            raise ValueError(f"Line {number}: invalid '{line}': {e!r}") from e
+        if item is None:
+            raise ValueError(f"Line {number}: unknown command '{line}'")
+        stack[-1].append(item)
+        if word == "loop":
+            stack.append(item[2])
+    if len(stack) != 1:
+        raise ValueError("Missing 'end' for 'loop'")
+    return root
+
+
+async def run_script(steps, client: BleakClient, characteristics=None):
+    for step in steps:
+        if step[0] == "send":
+            accepted = await send_command(step[1], client, characteristics)
+            if accepted and characteristics is None:
+                characteristics = accepted
+        elif step[0] == "wait":
+            await asyncio.sleep(step[1])
+        elif step[0] == "loop":
+            count, body = step[1], step[2]
+            i = 0
+            while count is None or i < count:
+                characteristics = await run_script(body, client, characteristics)
+                i += 1
+    return characteristics
+
+
+# Find devices by name or uuid. A single target stops scanning at the first match,
+# several targets share one discovery pass.
+async def find_devices(names=(), uuids=()):
+    targets = [("name", n) for n in names or ()] + [("address", u) for u in uuids or ()]
+    if not targets:
         raise ValueError("You must provide either a name or a uuid")
 
-    async with BleakClient(device.address) as client:
-        await send_command(command, client)
-
-
-async def main(command: bytearray = None, name: str = None, uuid: str = None):
-    if command is None:
+    if len(targets) == 1:
+        attr, value = targets[0]
+        device = await Scanner.find_device_by_filter(
+            lambda device, data: getattr(device, attr) == value
+        )
+        found = [(targets[0], device)]
+    else:
+        discovered = await Scanner.discover()
+        found = []
+        for attr, value in targets:
+            taken = [d for _, d in found]
+            device = next(
+                (d for d in discovered if getattr(d, attr) == value and d not in taken), None
+            )
+            found.append(((attr, value), device))
+
+    missing = [value for (attr, value), device in found if device is None]
+    if missing:
+        raise ValueError(f"Device not found: {', '.join(missing)}")
+    return [device for _, device in found]
+
+
+# Connect once to every device and run the same steps on all of them concurrently.
+async def run_on_devices(steps, names=(), uuids=()):
+    devices = await find_devices(names, uuids)
+
+    async def run_one(device):
+        async with Client(device.address) as client:
+            await run_script(steps, client)
+            if hasattr(client, "state"):
+                print(f"{device}: {client.state.as_dict()}")
+
+    await asyncio.gather(*(run_one(device) for device in devices))
+
+
+async def main(command: bytearray = None, names=(), uuids=(), script=None):
+    if script is not None:
+        await run_on_devices(script, names, uuids)
+    elif command is None:
         await scan()
     else:
-        await send_command_once(command, name, uuid)
+        await run_on_devices([("send", command)], names, uuids)
 
 
 if __name__ == "__main__":
@@ -60,6 +174,10 @@ Available commands are:
 
 Available effects are:
 \n\t- {effects}
+
+Scripts (--script) contain one command per line plus:
+\n\t- wait <seconds>
+\n\t- loop [count] ... end
 """.format(
         commands="\n\t- ".join(COMMANDS.keys()), effects="\n\t- ".join(EFFECTS.keys())
     )
@@ -70,35 +188,45 @@ Available effects are:
         formatter_class=argparse.RawTextHelpFormatter,
     )
     parser.add_argument(
-        "--name", help="Name of the ledstrip, usually 'ELK-BLEDOM' or 'ELK-BLEDOB'."
+        "--name",
+        action="append",
+        help="Name of the ledstrip, usually 'ELK-BLEDOM' or 'ELK-BLEDOB'. Repeat to target several strips.",
     )
     parser.add_argument(
-        "--uuid", help="Uuid of the specific ledstrip you want to connect to."
+        "--uuid",
+        action="append",
+        help="Uuid of the specific ledstrip you want to connect to. Repeat to target several strips.",
     )
     parser.add_argument(
         "--command",
         help="Command to send to the ledstrip. Use quotes for parameters: '--command set_color 255 0 0'",
     )
+    parser.add_argument(
+        "--script",
+        help="File with commands to run over one connection, '-' to read from stdin.",
+    )
+    parser.add_argument(
+        "--fake",
+        nargs="?",
+        const="1",
+        help="Use simulated strips, optionally with a link profile: 'count=2,latency=0.02,drop=0.01,rate=60'",
+    )
     args = parser.parse_args()
 
+    if args.fake:
+        Scanner = FakeBleakScanner.from_spec(args.fake)
+        Client = Scanner.client_factory
+
     command = None
     if args.command:
-        argCommand, *rest = args.command.split(" ")
-        key = next(
-            (
-                command
-                for command, fn in COMMANDS.items()
-                if command.startswith(argCommand)
-            ),
-            None,
-        )
-
-        if key is not None:
-            if key == "set_effect <effect>":
-                intParams = [EFFECTS[rest[0]]]
-            else:
-                intParams = [int(param) for param in rest]
+        command = parse_command(args.command)
 
-            command = COMMANDS[key](*intParams)
+    script = None
+    if args.script:
+        if args.script == "-":
+            script = parse_script(sys.stdin.read().splitlines())
+        else:
+            with open(args.script, encoding="utf-8") as f:
+                script = parse_script(f.read().splitlines())
 
-    asyncio.run(main(name=args.name, uuid=args.uuid, command=command))
+    asyncio.run(main(command=command, names=args.name, uuids=args.uuid, script=script))
@@ -0,0 +1,265 @@
+import asyncio
+import random
+import time
+
+# Имитация ленты ELK-BLEDOM без железа: разбирает 9-байтовые кадры из protocol.py
+# в состояние устройства и моделирует задержку, потери, обрывы и пропускную способность канала.
+
+WRITE_CHAR_UUID = "0000fff3-0000-1000-8000-00805f9b34fb"
+NOTIFY_CHAR_UUID = "0000fff4-0000-1000-8000-00805f9b34fb"
+
+
+class FakeBLEError(Exception):
+    pass
+
+
+class LinkProfile:
+    # transmit_time — сколько канал занят одним кадром (примерно одно событие соединения BLE);
+    # платят все записи, в том числе без подтверждения
+    def __init__(self, latency=0.015, jitter=0.005, drop_rate=0.0, disconnect_rate=0.0,
+                 max_writes_per_second=None, connect_delay=0.2, transmit_time=0.0075):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.disconnect_rate = disconnect_rate
+        self.max_writes_per_second = max_writes_per_second
+        self.connect_delay = connect_delay
+        self.transmit_time = transmit_time
+
+
+SPEC_KEYS = {
+    "latency": ("latency", float),
+    "jitter": ("jitter", float),
+    "drop": ("drop_rate", float),
+    "disconnect": ("disconnect_rate", float),
+    "rate": ("max_writes_per_second", float),
+    "connect": ("connect_delay", float),
+    "tx": ("transmit_time", float),
+}
+
+
+def parse_spec(spec):
+    # "count=3,latency=0.02,drop=0.01,rate=50" -> (количество устройств, LinkProfile)
+    count = 1
+    kwargs = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        key, _, value = part.partition("=")
+        if key == "count":
+            count = int(value)
+        elif key in SPEC_KEYS:
+            name, cast = SPEC_KEYS[key]
+            kwargs[name] = cast(value)
+        elif key not in ("1", "true", "yes"):
+            raise ValueError(f"Unknown fake BLE option: {key}")
+    return count, LinkProfile(**kwargs)
+
+
+class FakeDevice:
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+
+    def __str__(self):
+        return f"{self.address}: {self.name}"
+
+
+class FakeCharacteristic:
+    def __init__(self, uuid, properties):
+        self.uuid = uuid
+        self.properties = properties
+
+
+class FakeServices:
+    def __init__(self):
+        self.characteristics = {
+            0: FakeCharacteristic(WRITE_CHAR_UUID, ["write", "write-without-response"]),
+            1: FakeCharacteristic(NOTIFY_CHAR_UUID, ["read", "notify"]),
+        }
+
+    def get_characteristic(self, uuid):
+        return next((c for c in self.characteristics.values() if c.uuid == uuid), None)
+
+
+class DeviceState:
+    def __init__(self):
+        self.power = False
+        self.color = (0, 0, 0)
+        self.brightness = 100
+        self.effect = None
+        self.effect_speed = 50
+
+    def apply(self, frame):
+        frame = bytes(frame)
+        if len(frame) != 9 or frame[0] != 0x7e or frame[8] != 0xef:
+            raise FakeBLEError(f"Malformed frame: {frame.hex()}")
+        cmd = frame[2]
+        if cmd == 0x04:
+            self.power = frame[3] == 0xf0
+        elif cmd == 0x05 and frame[3] == 0x03:
+            self.color = (frame[4], frame[5], frame[6])
+        elif cmd == 0x01:
+            self.brightness = frame[3]
+        elif cmd == 0x03:
+            self.effect = frame[3]
+        elif cmd == 0x02:
+            self.effect_speed = frame[3]
+        else:
+            raise FakeBLEError(f"Unknown command: {frame.hex()}")
+
+    def as_dict(self):
+        return {
+            "power": self.power,
+            "color": self.color,
+            "brightness": self.brightness,
+            "effect": self.effect,
+            "effect_speed": self.effect_speed,
+        }
+
+
+class LinkStats:
+    def __init__(self):
+        self.writes = 0
+        self.applied = 0
+        self.dropped = 0
+        self.disconnects = 0
+        self.bytes = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def as_dict(self):
+        done = max(1, self.writes)
+        return {
+            "writes": self.writes,
+            "applied": self.applied,
+            "dropped": self.dropped,
+            "disconnects": self.disconnects,
+            "bytes": self.bytes,
+            "avg_latency": self.total_latency / done,
+            "max_latency": self.max_latency,
+        }
+
+
+class FakeBleakClient:
+    def __init__(self, address_or_device, disconnected_callback=None, profile=None, rng=None, **kwargs):
+        self.address = getattr(address_or_device, "address", address_or_device)
+        self.profile = profile or LinkProfile()
+        self.state = DeviceState()
+        self.stats = LinkStats()
+        self.services = FakeServices()
+        self._disconnected_callback = disconnected_callback
+        self._connected = False
+        self._rng = rng or random.Random()
+        self._link_free_at = 0.0
+        self._link_lock = asyncio.Lock()
+
+    @property
+    def is_connected(self):
+        return self._connected
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(self.profile.connect_delay)
+        self._connected = True
+        return True
+
+    async def disconnect(self):
+        self._connected = False
+        return True
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    async def read_gatt_char(self, char_specifier, **kwargs):
+        self._check_connected()
+        await asyncio.sleep(self._delay())
+        return bytearray(b"\x00")
+
+    async def write_gatt_char(self, char_specifier, data, response=None):
+        self._check_connected()
+        if getattr(char_specifier, "uuid", char_specifier) != WRITE_CHAR_UUID:
+            raise FakeBLEError("Characteristic does not support write")
+        started = time.perf_counter()
+        profile = self.profile
+
+        # Кадры передаются по одному: каждый занимает канал на transmit_time,
+        # но не меньше 1 / max_writes_per_second; остальные ждут своей очереди
+        interval = profile.transmit_time
+        if profile.max_writes_per_second:
+            interval = max(interval, 1.0 / profile.max_writes_per_second)
+        if interval:
+            async with self._link_lock:
+                now = time.perf_counter()
+                slot = max(now, self._link_free_at)
+                self._link_free_at = slot + interval
+            done = slot + profile.transmit_time
+            if done > now:
+                await asyncio.sleep(done - now)
+
+        # Запись без ответа не ждёт подтверждения — только передачу в канал
+        if response is not False:
+            await asyncio.sleep(self._delay())
+
+        self.stats.writes += 1
+        self.stats.bytes += len(data)
+        latency = time.perf_counter() - started
+        self.stats.total_latency += latency
+        self.stats.max_latency = max(self.stats.max_latency, latency)
+
+        if profile.disconnect_rate and self._rng.random() < profile.disconnect_rate:
+            self._drop_connection()
+            raise FakeBLEError("Device disconnected during write")
+        if profile.drop_rate and self._rng.random() < profile.drop_rate:
+            self.stats.dropped += 1
+            if response is not False:
+                raise FakeBLEError("Write not acknowledged")
+            return
+        self.state.apply(data)
+        self.stats.applied += 1
+
+    def _delay(self):
+        return max(0.0, self.profile.latency + self._rng.uniform(-self.profile.jitter, self.profile.jitter))
+
+    def _check_connected(self):
+        if not self._connected:
+            raise FakeBLEError("Not connected")
+
+    def _drop_connection(self):
+        self._connected = False
+        self.stats.disconnects += 1
+        if self._disconnected_callback:
+            self._disconnected_callback(self)
+
+
+class FakeBleakScanner:
+    def __init__(self, count=1, profile=None, name="ELK-BLEDOM"):
+        self.profile = profile or LinkProfile()
+        self.devices = [
+            FakeDevice(f"{name}-SIM{i + 1}", f"00:00:00:00:00:{i + 1:02X}") for i in range(count)
+        ]
+        self.clients = {}
+
+    @classmethod
+    def from_spec(cls, spec):
+        count, profile = parse_spec(spec)
+        return cls(count, profile)
+
+    async def discover(self, **kwargs):
+        await asyncio.sleep(min(0.5, self.profile.connect_delay))
+        return list(self.devices)
+
+    async def find_device_by_filter(self, filterfunc, **kwargs):
+        return next((d for d in self.devices if filterfunc(d, None)), None)
+
+    def client_factory(self, address_or_device, **kwargs):
+        # Клиент на каждый адрес один, чтобы состояние ленты переживало переподключения
+        address = getattr(address_or_device, "address", address_or_device)
+        client = FakeBleakClient(address_or_device, profile=self.profile, **kwargs)
+        previous = self.clients.get(address)
+        if previous is not None:
+            client.state = previous.state
+            client.stats = previous.stats
+        self.clients[address] = client
+        return client
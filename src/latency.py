@@ -0,0 +1,27 @@
+import time
+
+
+class LatencyTracker:
+    # Сглаженные оценки задержек конвейера: анализ (от захвата блока) и запись по BLE
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.analysis = 0.0
+        self.ble = 0.0
+
+    def _ema(self, current, sample):
+        return sample if current == 0.0 else current + self.alpha * (sample - current)
+
+    def update_analysis(self, capture_time, now=None):
+        now = time.perf_counter() if now is None else now
+        self.analysis = self._ema(self.analysis, max(0.0, now - capture_time))
+
+    def update_ble(self, sample):
+        self.ble = self._ema(self.ble, sample)
+
+    def deadline(self, capture_time, frame_period):
+        # Кадр, не отправленный к моменту, когда уже готов следующий, устарел
+        return capture_time + self.analysis + self.ble + frame_period
+
+    def lead(self, output_latency=0.0):
+        # Для файлов: насколько раньше звука отправлять кадр, чтобы свет и звук совпали
+        return self.ble - output_latency
@@ -0,0 +1,107 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+
+class RateLimitFilter(logging.Filter):
+    # Сообщения с одного и того же места в коде (файл + строка + уровень) считаются похожими.
+    # В каждом окне пропускается burst штук, остальные только подсчитываются.
+    def __init__(self, interval=10.0, burst=5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno, record.levelno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0, None]
+                if suppressed:
+                    record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+                    record.args = None
+                return True
+            window[1] += 1
+            if window[1] <= self.burst:
+                return True
+            window[2] += 1
+            window[3] = record
+            return False
+
+    def collect(self, now=None, force=False):
+        # Закрывает истёкшие окна (при force — все) и возвращает итоговые записи о подавленных сообщениях,
+        # чтобы счётчик попал в лог, даже если та же строка больше не сработает
+        now = time.monotonic() if now is None else now
+        summaries = []
+        with self._lock:
+            for key, window in list(self._windows.items()):
+                if not force and now - window[0] < self.interval:
+                    continue
+                del self._windows[key]
+                if window[2]:
+                    summary = logging.makeLogRecord(window[3].__dict__)
+                    summary.msg = f"{window[3].getMessage()} ({window[2]} similar messages suppressed)"
+                    summary.args = None
+                    summary.exc_info = None
+                    summary.exc_text = None
+                    summaries.append(summary)
+        return summaries
+
+
+def setup_logging(path, level=None, max_bytes=1_000_000, backup_count=3, interval=10.0, burst=5):
+    level = level or os.environ.get("LOTUS_LOG_LEVEL", "INFO")
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    # Вызывающий поток только кладёт запись в очередь, запись на диск идёт в потоке listener
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    rate_limit = RateLimitFilter(interval, burst)
+    queue_handler.addFilter(rate_limit)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+
+    def report_suppressed(force=False):
+        # Итоги кладутся в очередь в обход фильтра
+        for summary in rate_limit.collect(force=force):
+            queue_handler.enqueue(queue_handler.prepare(summary))
+
+    stop = threading.Event()
+
+    def report_loop():
+        while not stop.wait(interval):
+            report_suppressed()
+
+    threading.Thread(target=report_loop, name="log-rate-limit", daemon=True).start()
+
+    def shutdown():
+        stop.set()
+        report_suppressed(force=True)
+        listener.stop()
+
+    atexit.register(shutdown)
+    return listener
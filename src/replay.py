@@ -0,0 +1,121 @@
+import argparse
+import asyncio
+import time
+
+from bleak import BleakClient, BleakScanner
+
+from .ble_controller import BLEController
+from .fake_ble import FakeBleakScanner
+from .batch_analyzer import play_with_audio
+from .session_recorder import SessionPlayer
+
+
+async def find_devices(scanner, names=(), uuids=()):
+    # Без --name/--uuid берутся все найденные ленты (удобно с --fake)
+    discovered = await scanner.discover()
+    if not names and not uuids:
+        return discovered
+    found = []
+    for attr, value in [("name", n) for n in names] + [("address", u) for u in uuids]:
+        device = next((d for d in discovered if getattr(d, attr) == value and d not in found), None)
+        if device is None:
+            raise ValueError(f"Device not found: {value}")
+        found.append(device)
+    return found
+
+
+async def replay(path, devices, client_factory, speed=1.0, lead=0.0, sent_only=True, connect_timeout=15.0,
+                 audio=None):
+    # Воспроизводит запись на лентах через те же BLEController, что и приложение.
+    # С audio вместе с дорожкой играет песня, а lead=None подбирается по измеренной задержке
+    loop = asyncio.get_running_loop()
+    controllers = [BLEController(loop, client_factory=client_factory) for _ in devices]
+    workers = [loop.create_task(c.run()) for c in controllers]
+    try:
+        for controller, device in zip(controllers, devices):
+            controller.queue_connect(device)
+        deadline = time.perf_counter() + connect_timeout
+        while not all(c.is_connected() for c in controllers):
+            if time.perf_counter() > deadline:
+                raise TimeoutError("Not all strips connected")
+            await asyncio.sleep(0.05)
+
+        finished = asyncio.Event()
+        on_finished = lambda: loop.call_soon_threadsafe(finished.set)
+        started = time.perf_counter()
+        if audio is not None:
+            player = play_with_audio(audio, path, controllers, lead=lead, on_finished=on_finished, sent_only=sent_only)
+        else:
+            player = SessionPlayer(path, controllers, speed=speed, lead=lead or 0.0, sent_only=sent_only)
+            player.start(on_finished=on_finished)
+        try:
+            await finished.wait()
+        finally:
+            player.stop()
+            if audio is not None:
+                import sounddevice as sd
+                sd.stop()
+        try:
+            await asyncio.wait_for(asyncio.gather(*(c.command_queue.join() for c in controllers)), 5.0)
+        except asyncio.TimeoutError:
+            pass
+        elapsed = time.perf_counter() - started
+
+        for controller in controllers:
+            controller.queue_disconnect()
+        await asyncio.gather(*(c.command_queue.join() for c in controllers))
+        return player, controllers, elapsed
+    finally:
+        for worker in workers:
+            worker.cancel()
+
+
+async def main(args):
+    if args.audio and args.speed != 1.0:
+        raise SystemExit("--speed cannot be combined with --audio")
+    if args.fake:
+        scanner = FakeBleakScanner.from_spec(args.fake)
+        client_factory = scanner.client_factory
+    else:
+        if not args.name and not args.uuid:
+            raise SystemExit("Specify --name or --uuid (or use --fake)")
+        scanner = BleakScanner
+        client_factory = BleakClient
+
+    devices = await find_devices(scanner, args.name or (), args.uuid or ())
+    player, controllers, elapsed = await replay(
+        args.recording, devices, client_factory, args.speed, args.lead, not args.all_frames, audio=args.audio
+    )
+    print(
+        f"{len(player.records)} frames in {elapsed:.2f}s: sent {player.frames_sent}, "
+        f"skipped {player.frames_skipped} late frames"
+    )
+    for device, controller in zip(devices, controllers):
+        line = (
+            f"{device.name or device.address}: redundant {controller.shadow.skipped}, "
+            f"stale {controller.stale_dropped}, ble latency {controller.latency.ble * 1000:.1f} ms"
+        )
+        if args.fake:
+            stats = scanner.clients[device.address].stats.as_dict()
+            line += f", applied {stats['applied']}, dropped {stats['dropped']}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded session (.llrec) to one or more strips.")
+    parser.add_argument("recording")
+    parser.add_argument("--name", action="append", help="Strip name. Repeat to target several strips.")
+    parser.add_argument("--uuid", action="append", help="Strip address. Repeat to target several strips.")
+    parser.add_argument(
+        "--fake",
+        nargs="?",
+        const="1",
+        help="Use simulated strips, optionally with a link profile: 'count=2,latency=0.02,drop=0.01,rate=60'",
+    )
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed multiplier.")
+    parser.add_argument("--lead", type=float, default=None,
+                        help="Send frames this many seconds early (default: 0, or measured when --audio is used).")
+    parser.add_argument("--audio", help="Play this audio file in sync with the track (e.g. the song it was built from).")
+    parser.add_argument("--all-frames", action="store_true",
+                        help="Also replay frames the live session computed but did not send.")
+    asyncio.run(main(parser.parse_args()))
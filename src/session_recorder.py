@@ -0,0 +1,177 @@
+import logging
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from .ble_commands import send_color
+
+MAGIC = b"LLREC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<5sBHd")  # magic, version, record size, start time (unix)
+HEADER_SIZE = HEADER.size
+
+FLAG_SENT = 0x01
+
+# Фиксированная запись: время от начала сессии, признаки полос и итоговый цвет
+RECORD_DTYPE = np.dtype([
+    ("t", "<f8"),
+    ("low", "<f4"),
+    ("mid", "<f4"),
+    ("high", "<f4"),
+    ("r", "u1"),
+    ("g", "u1"),
+    ("b", "u1"),
+    ("flags", "u1"),
+])
+
+
+def write_header(f, start_time):
+    f.write(HEADER.pack(MAGIC, FORMAT_VERSION, RECORD_DTYPE.itemsize, start_time))
+
+
+def read_header(f):
+    magic, version, record_size, start_time = HEADER.unpack(f.read(HEADER_SIZE))
+    if magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError("Unsupported recording format")
+    return start_time
+
+
+class SessionRecorder:
+    def __init__(self, path, buffer_records=256):
+        self.path = path
+        self._lock = threading.Lock()
+        self._buffer = np.zeros(buffer_records, dtype=RECORD_DTYPE)
+        self._count = 0
+        self._start = time.perf_counter()
+        self.records_written = 0
+
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self._file = open(path, "wb")
+            write_header(self._file, time.time())
+        else:
+            # Дописываем в существующий файл, продолжая его шкалу времени
+            existing = load_recording(path)
+            count = len(existing)
+            if count:
+                self._start -= float(existing["t"][-1])
+            del existing
+            self._file = open(path, "r+b")
+            # Незавершённая запись после сбоя обрезается, чтобы не сбить выравнивание
+            self._file.truncate(HEADER_SIZE + count * RECORD_DTYPE.itemsize)
+            self._file.seek(0, os.SEEK_END)
+
+    def record(self, low, mid, high, color, sent=True, timestamp=None):
+        t = (timestamp if timestamp is not None else time.perf_counter()) - self._start
+        with self._lock:
+            if self._file is None:
+                return
+            rec = self._buffer[self._count]
+            rec["t"] = t
+            rec["low"], rec["mid"], rec["high"] = low, mid, high
+            rec["r"], rec["g"], rec["b"] = color
+            rec["flags"] = FLAG_SENT if sent else 0
+            self._count += 1
+            if self._count == len(self._buffer):
+                self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._flush_locked()
+            self._file.close()
+            self._file = None
+
+    def _flush_locked(self):
+        if self._count:
+            self._file.write(self._buffer[:self._count].tobytes())
+            self._file.flush()
+            self.records_written += self._count
+            self._count = 0
+
+
+def load_recording(path):
+    with open(path, "rb") as f:
+        read_header(f)
+    size = os.path.getsize(path) - HEADER_SIZE
+    count = size // RECORD_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD_DTYPE)
+    # Незавершённый хвост после сбоя просто отбрасывается
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+class SessionPlayer:
+    def __init__(self, path, controllers, speed=1.0, lead=0.0, sent_only=True):
+        records = load_recording(path)
+        if sent_only and len(records):
+            records = records[(records["flags"] & FLAG_SENT) != 0]
+        self.records = records
+        self.controllers = list(controllers)
+        self.speed = speed
+        self.lead = lead
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, on_finished=None):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._play, args=(on_finished,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def is_playing(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _play(self, on_finished):
+        records = self.records
+        if len(records) == 0:
+            if on_finished:
+                on_finished()
+            return
+        times = records["t"] / self.speed - self.lead
+        colors = np.stack([records["r"], records["g"], records["b"]], axis=1).tolist()
+        start = time.perf_counter()
+        n = len(times)
+        i = 0
+        try:
+            while i < n and not self._stop.is_set():
+                remaining = times[i] - (time.perf_counter() - start)
+                if remaining > 0.002:
+                    # Грубый сон с запасом, затем короткое ожидание для точности на Windows
+                    self._stop.wait(remaining - 0.002)
+                    continue
+                while times[i] - (time.perf_counter() - start) > 0:
+                    pass
+
+                # Если отстали, берём самый свежий кадр вместо очереди устаревших
+                now = time.perf_counter() - start
+                j = i
+                while j + 1 < n and times[j + 1] <= now:
+                    j += 1
+                self.frames_skipped += j - i
+                color = tuple(colors[j])
+                for controller in self.controllers:
+                    controller.queue_stream(send_color, color)
+                self.frames_sent += 1
+                i = j + 1
+        except Exception as e:
+            logging.error(f"Playback error: {e}")
+        finally:
+            if on_finished:
+                on_finished()
+
+
+def write_recording(path, records, start_time=None):
+    with open(path, "wb") as f:
+        write_header(f, time.time() if start_time is None else start_time)
+        f.write(np.ascontiguousarray(records, dtype=RECORD_DTYPE).tobytes())
@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+SCHEMA_VERSION = 2
+DEFAULT_PROFILE = "default"
+
+
+def _migrate_v0_to_v1(config):
+    # Support older config values saved in 0-255 range by mapping to 0-100
+    raw_b = config.get("brightness", 50)
+    try:
+        raw_b = int(raw_b)
+    except Exception:
+        raw_b = 50
+    if raw_b > 100:
+        raw_b = int(round(raw_b * 100.0 / 255.0))
+    config["brightness"] = max(0, min(100, raw_b))
+    return config
+
+
+def _migrate_v1_to_v2(config):
+    # Плоский конфиг становится профилем по умолчанию
+    return {"active_profile": DEFAULT_PROFILE, "profiles": {DEFAULT_PROFILE: config}}
+
+
+MIGRATIONS = {
+    0: _migrate_v0_to_v1,
+    1: _migrate_v1_to_v2,
+}
+
+
+def migrate(config):
+    version = config.pop("version", 0)
+    while version < SCHEMA_VERSION:
+        config = MIGRATIONS[version](config)
+        version += 1
+    return config
+
+
+class SettingsStore:
+    def __init__(self, path, defaults, delay=1.0):
+        self.path = path
+        self.defaults = dict(defaults)
+        self.delay = delay
+        self.active_profile = DEFAULT_PROFILE
+        self._profiles = {DEFAULT_PROFILE: dict(self.defaults)}
+
+        self._cond = threading.Condition()
+        self._deadline = None
+        self._generation = 0
+        self._written = 0
+        self._closed = False
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+    def load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = migrate(json.load(f))
+                with self._cond:
+                    self._profiles = {
+                        name: {**self.defaults, **values}
+                        for name, values in data.get("profiles", {}).items()
+                    } or {DEFAULT_PROFILE: dict(self.defaults)}
+                    self.active_profile = data.get("active_profile", DEFAULT_PROFILE)
+                    if self.active_profile not in self._profiles:
+                        self.active_profile = next(iter(self._profiles))
+            except Exception as e:
+                logging.error(f"Error loading settings: {e}")
+        return self.get()
+
+    def get(self, profile=None):
+        with self._cond:
+            return dict(self._profiles.get(profile or self.active_profile, self.defaults))
+
+    def profiles(self):
+        with self._cond:
+            return list(self._profiles)
+
+    def save(self, settings, profile=None):
+        with self._cond:
+            name = profile or self.active_profile
+            self._profiles[name] = {**self._profiles.get(name, self.defaults), **settings}
+            self._schedule()
+
+    def switch_profile(self, name):
+        with self._cond:
+            if name not in self._profiles:
+                self._profiles[name] = dict(self._profiles[self.active_profile])
+            self.active_profile = name
+            self._schedule()
+        return self.get(name)
+
+    def delete_profile(self, name):
+        with self._cond:
+            if name == self.active_profile or name not in self._profiles:
+                return False
+            del self._profiles[name]
+            self._schedule()
+        return True
+
+    def flush(self, timeout=2.0):
+        with self._cond:
+            if self._written == self._generation:
+                return True
+            target = self._generation
+            self._deadline = time.monotonic()
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._written >= target, timeout)
+
+    def close(self, timeout=2.0):
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        return flushed
+
+    def _schedule(self):
+        # Каждое изменение откладывает запись; серия движений слайдера даёт одну запись
+        self._generation += 1
+        self._deadline = time.monotonic() + self.delay
+        self._cond.notify_all()
+
+    def _snapshot(self):
+        return {
+            "version": SCHEMA_VERSION,
+            "active_profile": self.active_profile,
+            "profiles": {name: dict(values) for name, values in self._profiles.items()},
+        }
+
+    def _writer_loop(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._written == self._generation:
+                    self._cond.wait()
+                if self._closed and self._written == self._generation:
+                    return
+                while True:
+                    remaining = self._deadline - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        break
+                    self._cond.wait(remaining)
+                generation = self._generation
+                data = self._snapshot()
+            self._write(data)
+            with self._cond:
+                self._written = generation
+                self._cond.notify_all()
+
+    def _write(self, data):
+        directory = os.path.dirname(self.path) or "."
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+        except Exception as e:
+            logging.error(f"Error saving settings: {e}")
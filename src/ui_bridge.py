@@ -0,0 +1,56 @@
+import logging
+import threading
+from collections import deque
+
+
+class UIBridge:
+    # Фоновые потоки не трогают виджеты Tk: они кладут данные сюда, а поток Tk забирает их
+    # с фиксированной частотой. Для состояния (publish) применяется только последнее значение,
+    # события (post) выполняются все и по порядку.
+    def __init__(self, widget, interval_ms=33):
+        self.widget = widget
+        self.interval_ms = interval_ms
+        self._lock = threading.Lock()
+        self._state = {}
+        self._events = deque()
+        self._handlers = {}
+        self._running = False
+
+    def publish(self, key, value):
+        with self._lock:
+            self._state[key] = value
+
+    def post(self, fn, *args):
+        with self._lock:
+            self._events.append((fn, args))
+
+    def subscribe(self, key, handler):
+        self._handlers[key] = handler
+
+    def start(self):
+        if not self._running:
+            self._running = True
+            self.widget.after(self.interval_ms, self._poll)
+
+    def stop(self):
+        self._running = False
+
+    def _poll(self):
+        if not self._running:
+            return
+        with self._lock:
+            state, self._state = self._state, {}
+            events, self._events = self._events, deque()
+        for fn, args in events:
+            try:
+                fn(*args)
+            except Exception as e:
+                logging.error(f"UI event error: {e}")
+        for key, value in state.items():
+            handler = self._handlers.get(key)
+            if handler:
+                try:
+                    handler(value)
+                except Exception as e:
+                    logging.error(f"UI update error ({key}): {e}")
+        self.widget.after(self.interval_ms, self._poll)
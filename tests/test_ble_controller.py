@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+from src.ble_commands import send_brightness, send_color, send_turn_on
+from src.ble_controller import BLEController
+from src.fake_ble import DeviceState, FakeBleakScanner
+
+# Быстрый канал без случайной задержки: порядок записей определяется только контроллером
+FAST_LINK = "count=1,latency=0,jitter=0,connect=0.01"
+
+
+async def _start(spec=FAST_LINK):
+    scanner = FakeBleakScanner.from_spec(spec)
+    loop = asyncio.get_running_loop()
+    controller = BLEController(loop, client_factory=scanner.client_factory, backoff_base=0.01)
+    worker = loop.create_task(controller.run())
+    device = (await scanner.discover())[0]
+    controller.queue_connect(device)
+    await _settle(controller)
+    assert controller.is_connected()
+    return scanner, controller, worker, device
+
+
+async def _settle(controller):
+    # queue_* кладут команды через run_coroutine_threadsafe — даём им дойти до очереди
+    await asyncio.sleep(0.05)
+    await controller.command_queue.join()
+    await controller._drain()
+
+
+async def _wait_for(condition, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_stream_a_b_a_ends_on_a():
+    async def scenario():
+        scanner, controller, worker, device = await _start()
+        a, b = (255, 0, 0), (0, 0, 255)
+        controller.queue_send(send_color, a)
+        await _settle(controller)
+        # Пока B ещё в полёте, второе A нельзя считать повтором подтверждённого A
+        for color in (b, a):
+            controller.queue_stream(send_color, color)
+        await _settle(controller)
+        worker.cancel()
+        return scanner.clients[device.address].state.color, a
+
+    color, expected = asyncio.run(scenario())
+    assert color == expected
+
+
+def test_reconnect_resync_restores_latest_state():
+    async def scenario():
+        scanner, controller, worker, device = await _start()
+        controller.queue_send(send_turn_on, force=True)
+        controller.queue_send(send_brightness, 30)
+        controller.queue_send(send_color, (10, 20, 30))
+        await _settle(controller)
+
+        # Лента теряет связь и питание: после переподключения её состояние сброшено
+        client = scanner.clients[device.address]
+        client.state = DeviceState()
+        client._drop_connection()
+        controller.queue_send(send_color, (40, 50, 60))
+        await _wait_for(lambda: controller.reconnect_count >= 1 and controller.is_connected())
+        await _settle(controller)
+        worker.cancel()
+        return scanner.clients[device.address].state.as_dict()
+
+    state = asyncio.run(scenario())
+    assert state["power"] is True
+    assert state["brightness"] == 30
+    assert state["color"] == (40, 50, 60)
+
+
+def test_control_write_after_in_flight_stream_writes():
+    async def scenario():
+        scanner, controller, worker, device = await _start()
+        for i in range(10):
+            controller.queue_stream(send_color, (i, i, i))
+        controller.queue_send(send_color, (200, 100, 0))
+        await _settle(controller)
+        worker.cancel()
+        return scanner.clients[device.address].state.color
+
+    assert asyncio.run(scenario()) == (200, 100, 0)
+
+
+def test_control_write_not_deduped_against_lost_stream_write():
+    async def scenario():
+        scanner, controller, worker, device = await _start()
+        controller.queue_send(send_color, (1, 2, 3))
+        await _settle(controller)
+
+        # Кадр потока без подтверждения теряется молча — тень не должна считать его применённым
+        scanner.profile.drop_rate = 1.0
+        controller.queue_stream(send_color, (0, 0, 0))
+        await _settle(controller)
+        scanner.profile.drop_rate = 0.0
+        controller.queue_send(send_color, (0, 0, 0))
+        await _settle(controller)
+        worker.cancel()
+        return scanner.clients[device.address].state.color
+
+    assert asyncio.run(scenario()) == (0, 0, 0)